@@ -4,6 +4,8 @@ from flask_login import login_user, logout_user, login_required, current_user
 import logging
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+from contextlib import contextmanager
+import threading
 
 from redis import Redis
 
@@ -17,7 +19,14 @@ from datetime import datetime
 import numpy as np
 import cv2
 
-from frame_analyzer import analyze_frame
+from frame_analyzer import (analyze_frame, analyze_frame_gated, track_frame, warmup_analyzer,
+                            set_working_resolution, set_quality_checks, set_engine,
+                            set_preprocess_profile)
+from frame_decode import FrameDecodeError, decode_frame
+from lane_session import LaneSession, SessionRegistry
+from lane_tracker import LaneTracker
+from motion_gate import MotionGate
+from stage_profiler import PROFILER
 
 def create_app():
     app = Flask(__name__)
@@ -34,6 +43,22 @@ def create_app():
 app = create_app()
 logging.basicConfig(level=logging.INFO)
 
+# 업로드 해상도와 관계없이 같은 해상도에서 분석 (기기별 지연 시간/점수 기준을 통일)
+working_size = None
+if app.config['ANALYZER_WORKING_SIZE']:
+    working_size = tuple(map(int, app.config['ANALYZER_WORKING_SIZE'].lower().split('x')))
+set_working_resolution(working_size)
+
+# 차선 검출 엔진 선택 (hough / birdseye)
+set_engine(app.config['ANALYZER_ENGINE'])
+set_preprocess_profile(app.config['ANALYZER_PROFILE'])
+
+# 어둡거나 흔들린 프레임은 검출 전에 걸러냄
+set_quality_checks(app.config['FRAME_QUALITY_CHECKS'])
+
+# 첫 /video_frame 요청이 초기화 비용을 내지 않도록 분석기를 미리 준비
+warmup_analyzer()
+
 def require_api_token(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -52,6 +77,46 @@ def require_api_token(f):
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+def new_lane_session():
+    """라이더 한 명의 주행 세션을 만드는 함수
+    
+    LANE_TRACKING 설정 시 차선 추적기를, MOTION_GATE_THRESHOLD > 0 이면 변화 감지기를 포함한다.
+    """
+    threshold = app.config['MOTION_GATE_THRESHOLD']
+    return LaneSession(
+        tracker=LaneTracker() if app.config['LANE_TRACKING'] else None,
+        gate=MotionGate(threshold=threshold) if threshold > 0 else None,
+    )
+
+# 라이더별 주행 세션 (주행 종료 시 제거, 버려진 주행은 LRU/TTL/메모리 상한으로 제거)
+lane_sessions = SessionRegistry(
+    new_lane_session,
+    max_sessions=app.config['LANE_SESSION_MAX'],
+    ttl=app.config['LANE_SESSION_TTL'],
+    max_bytes=app.config['LANE_SESSION_MEMORY_MB'] * 1024 ** 2,
+)
+
+# /video_frame 분석은 ANALYZER_WORKERS 개까지만 동시에 수행하고, 나머지 요청은 슬롯을 기다린다
+# (기다리는 요청 수가 SCANLINE_QUEUE_DEPTH 를 넘으면 scanline 엔진으로 전환)
+inference_slots = threading.BoundedSemaphore(app.config['ANALYZER_WORKERS'])
+inference_lock = threading.Lock()
+inference_waiting = 0
+
+@contextmanager
+def inference_slot():
+    """분석 슬롯을 얻을 때까지 기다린 뒤, 그때 아직 슬롯을 기다리는 요청 수 (밀린 분석 수) 를 넘겨주는 컨텍스트"""
+    global inference_waiting
+    with inference_lock:
+        inference_waiting += 1
+    inference_slots.acquire()
+    with inference_lock:
+        inference_waiting -= 1
+        backlog = inference_waiting
+    try:
+        yield backlog
+    finally:
+        inference_slots.release()
+
 class FrameBuffer:
     def __init__(self):
         self.scores = []
@@ -120,26 +185,65 @@ def process_video_frame():
             
         frame_file = request.files['frame']
         frame_id = int(request.form['frame_id'])
+        timer = PROFILER.timer()
 
-        # Decode base64 frame
-        file_bytes = np.frombuffer(frame_file.read(), np.uint8)
-        frame_array = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+        # 분석은 흑백으로 하므로 흑백으로, 작업 해상도가 있으면 그 근처까지 줄여서 디코딩
+        # (크기가 너무 크거나 헤더가 깨진 JPEG 는 디코딩 전에 거부, 다른 형식은 원본 크기로 디코딩)
+        file_bytes = frame_file.read()
+        try:
+            if app.config['FRAME_GRAYSCALE_DECODE']:
+                frame_array, factor = decode_frame(
+                    file_bytes, working_size,
+                    max_bytes=app.config['FRAME_MAX_BYTES'], max_pixels=app.config['FRAME_MAX_PIXELS'])
+            else:
+                frame_array = cv2.imdecode(np.frombuffer(file_bytes, np.uint8), cv2.IMREAD_COLOR)
+                if frame_array is None:
+                    raise FrameDecodeError("Failed to decode frame")
+                factor = 1
+        except FrameDecodeError as e:
+            return jsonify({'error': str(e)}), 400
+        timer.mark("decode")
 
-        # save frame_array to file
-        frame_data = analyze_frame(frame_array)
+        # 분석 상태는 라이더별 세션에만 있으므로 분석기 주변에 잠금이 필요 없다
+        session = lane_sessions.get(current_user.id)
+
+        with inference_slot() as backlog:
+            # 분석이 밀려 있으면 정확도를 조금 포기하고 scanline 엔진으로 처리
+            max_backlog = app.config['SCANLINE_QUEUE_DEPTH']
+            engine = 'scanline' if 0 < max_backlog < backlog else None
+
+            # save frame_array to file
+            if session.tracker is not None:
+                analyze = lambda frame: track_frame(frame, session.tracker, engine)
+            else:
+                analyze = lambda frame: analyze_frame(frame, engine, session)
+            
+            # 직전에 분석한 프레임과 거의 같으면 (신호 대기 등) 이전 결과 재사용
+            if session.gate is not None:
+                frame_data = analyze_frame_gated(frame_array, session.gate, analyze)
+            else:
+                frame_data = dict(analyze(frame_array), reused=False)
+        timer.skip()  # 분석 단계별 시간은 frame_analyzer / lane_analyzer 가 기록
 
         if frame_data['score'] is None:
-            return jsonify({"score": -1.0, "frame_id": frame_id, "road_outline": None }), 200
+            response = jsonify({"score": -1.0, "frame_id": frame_id, "road_outline": None,
+                                "reused": frame_data['reused'],
+                                "reject_reason": frame_data['reject_reason']})
+            timer.mark("json")
+            timer.done()
+            return response, 200
 
         # Placeholder for score calculation and road outline detection
+        # 축소 디코딩한 프레임의 좌표를 업로드 원본 좌표로 되돌림
         score = frame_data['score']  # Example score
+        scale_x = scale_y = factor
         road_outline = {
-            "bottom_x_r": frame_data['road_outline']['bottom_x_r'],
-            "bottom_x_s": frame_data['road_outline']['bottom_x_s'],
-            "bottom_y": frame_data['road_outline']['bottom_y'],
-            "top_x_r": frame_data['road_outline']['top_x_r'],
-            "top_x_s": frame_data['road_outline']['top_x_s'],
-            "top_y": frame_data['road_outline']['top_y'] 
+            "bottom_x_r": frame_data['road_outline']['bottom_x_r'] * scale_x,
+            "bottom_x_s": frame_data['road_outline']['bottom_x_s'] * scale_x,
+            "bottom_y": frame_data['road_outline']['bottom_y'] * scale_y,
+            "top_x_r": frame_data['road_outline']['top_x_r'] * scale_x,
+            "top_x_s": frame_data['road_outline']['top_x_s'] * scale_x,
+            "top_y": frame_data['road_outline']['top_y'] * scale_y
         }
 
         # Store score in Db
@@ -150,14 +254,20 @@ def process_video_frame():
         )
         db.session.add(frame_data_record)
         db.session.commit()
+        timer.mark("database")
 
         response = {
             "score": score,
             "frame_id": frame_id,
-            "road_outline": road_outline
+            "road_outline": road_outline,
+            "reused": frame_data['reused'],
+            "reject_reason": frame_data['reject_reason']
         }
 
-        return jsonify(response), 200
+        response = jsonify(response)
+        timer.mark("json")
+        timer.done()
+        return response, 200
 
     except Exception as e:
         logging.error(f"Error processing video frame: {str(e)}")
@@ -185,6 +295,11 @@ def end_ride():
         db.session.add(score_history)
         
         # Clear frame data
+        session = lane_sessions.pop(current_user.id)
+        if session is not None and session.gate is not None:
+            gate = session.gate
+            logging.info(f"Motion gate hit rate for user {current_user.id}: "
+                         f"{gate.hits}/{gate.checks} ({gate.hit_rate():.1%})")
         FrameData.query.filter_by(user_id=current_user.id).delete()
         
         # Commit changes
@@ -207,4 +322,4 @@ if __name__ == '__main__':
         socketio.run(app, host='0.0.0.0', port=5000, debug=debug_mode)
     else:
         import waitress
-        waitress.serve(app, host='0.0.0.0', port=5000)
+        waitress.serve(app, host='0.0.0.0', port=5000, threads=app.config['SERVER_THREADS'])
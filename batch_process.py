@@ -0,0 +1,222 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import cv2
+
+from frame_store import parse_size
+from lane_detection import iter_lane_results, new_session, set_roi_height
+from main import write_results_csv
+
+# 디렉토리 입력에서 처리할 영상 확장자
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.m4v')
+
+# 출력 디렉토리에 남기는 완료 기록 (영상 하나가 끝날 때마다 JSON 한 줄씩 추가)
+MANIFEST_NAME = 'batch_manifest.jsonl'
+
+# main.py 와 같은 기본 ROI 높이
+DEFAULT_ROI_RATIO = 0.8
+
+# 점수 계산에 쓰이는 검출기/추적기/세션/전처리 모듈 (소스가 바뀌면 완료 기록의 분석기 버전이 달라져서 모든 영상을 다시 처리)
+ANALYZER_MODULES = ('lane_detection', 'lane_analyzer', 'lane_tracker', 'lane_session', 'frame_artifacts')
+
+
+def find_videos(source):
+    """디렉토리 (바로 아래의 영상 파일) 또는 목록 파일 (한 줄에 경로 하나, # 주석) 에서 영상 경로를 모으는 함수
+
+    목록 파일의 상대 경로는 목록 파일이 있는 디렉토리 기준이다.
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                 if name.lower().endswith(VIDEO_EXTENSIONS)]
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source) as f:
+            lines = (line.strip() for line in f)
+            paths = [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+    return [os.path.abspath(path) for path in paths]
+
+
+def results_names(videos):
+    """영상별 결과 파일 이름 (<이름>.csv, 이름이 겹치면 경로 해시를 붙임) 을 만드는 함수"""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in videos]
+    names = {}
+    for path, stem in zip(videos, stems):
+        if stems.count(stem) > 1:
+            stem = f"{stem}-{hashlib.sha1(path.encode()).hexdigest()[:8]}"
+        names[path] = stem + '.csv'
+    return names
+
+
+def analyzer_version(modules=ANALYZER_MODULES):
+    """분석기 모듈 소스의 해시 (완료 기록의 분석 설정에 넣어 분석기가 바뀐 뒤의 재실행을 구분)"""
+    digest = hashlib.sha1()
+    for name in modules:
+        with open(importlib.import_module(name).__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def video_key(path, settings):
+    """완료 기록과 비교할 영상 식별 정보 (경로, 크기, 수정 시각, 분석 설정과 분석기 버전)"""
+    stat = os.stat(path)
+    return {"video": path, "bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns, "settings": settings}
+
+
+def load_manifest(manifest_path):
+    """완료 기록을 읽어서 영상 경로별 마지막 기록을 반환하는 함수 (중단 중에 잘린 마지막 줄은 무시)"""
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["video"]] = record
+    return records
+
+
+def is_finished(record, key, output_dir):
+    """같은 영상/설정으로 이미 끝냈고 결과 파일도 남아 있는지 확인하는 함수"""
+    if record is None or any(record.get(name) != value for name, value in key.items()):
+        return False
+    return os.path.exists(os.path.join(output_dir, record["results"]))
+
+
+def score_video(video_path, results_path, size, roi_ratio):
+    """영상 하나의 점수를 계산해서 results_path 에 CSV 로 쓰는 함수 (작업 프로세스에서 실행)
+
+    size 가 None 이면 main.py 처럼 원본의 1/2 크기로 분석한다.
+    결과는 같은 디렉토리의 임시 파일에 다 쓴 뒤 os.replace 로 바꿔치기하므로,
+    중단되어도 results_path 에는 완성된 파일만 남는다.
+    """
+    set_roi_height(roi_ratio)
+    started = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video source: {video_path!r}")
+    if size is None:
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) // 2, int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) // 2)
+
+    session = new_session()
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(results_path) + '.',
+                                     dir=os.path.dirname(results_path))
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            frame_count, detections = write_results_csv(iter_lane_results(cap, size=size, session=session), f)
+            f.flush()
+            os.fsync(f.fileno())
+        if frame_count == 0:
+            raise IOError(f"No frames could be read from {video_path!r}")
+        os.replace(temp_path, results_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    finally:
+        cap.release()
+
+    return {
+        "frames": frame_count,
+        "detections": detections,
+        "score": session.total_score,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_batch(source, output_dir, workers=None, size=None, roi_ratio=DEFAULT_ROI_RATIO, force=False):
+    """source (디렉토리 또는 목록 파일) 의 영상들을 프로세스 풀에서 채점하는 함수 (실패한 영상 수를 반환)
+
+    영상 하나가 끝날 때마다 결과 CSV 를 output_dir 에 쓰고 MANIFEST_NAME 에 완료를 기록한다.
+    다시 실행하면 같은 파일 (크기/수정 시각) 을 같은 설정과 분석기 버전 (ANALYZER_MODULES 소스 해시) 으로
+    이미 끝낸 영상은 건너뛴다 (force 이면 모두 다시).
+    workers 가 None 이면 CPU 수만큼 프로세스를 쓴다.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    settings = {"size": list(size) if size else None, "roi_ratio": roi_ratio, "analyzer": analyzer_version()}
+
+    videos = find_videos(source)
+    names = results_names(videos)
+    records = {} if force else load_manifest(manifest_path)
+
+    pending = []
+    failures = 0
+    for path in videos:
+        if not os.path.exists(path):
+            print(f"에러: 비디오 파일을 찾을 수 없습니다: {path}")
+            failures += 1
+            continue
+        key = video_key(path, settings)
+        if not is_finished(records.get(path), key, output_dir):
+            pending.append((path, key))
+
+    print(f"영상 {len(videos)}개 중 {len(videos) - len(pending) - failures}개는 이미 처리됨, "
+          f"{len(pending)}개 처리 시작")
+    if not pending:
+        return failures
+
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    started = time.perf_counter()
+    total_frames = 0
+    completed = 0
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        with open(manifest_path, 'a') as manifest:
+            futures = {
+                executor.submit(score_video, path, os.path.join(output_dir, names[path]), size, roi_ratio): (path, key)
+                for path, key in pending
+            }
+            for future in as_completed(futures):
+                path, key = futures[future]
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    print(f"에러: {path} 처리 실패: {e}")
+                    failures += 1
+                    continue
+
+                record = dict(key, results=names[path], completed_at=datetime.now().isoformat(timespec='seconds'),
+                              **stats)
+                manifest.write(json.dumps(record, ensure_ascii=False) + '\n')
+                manifest.flush()
+                os.fsync(manifest.fileno())
+
+                completed += 1
+                total_frames += stats["frames"]
+                print(f"[{completed}/{len(pending)}] {os.path.basename(path)}: {stats['frames']} 프레임, "
+                      f"점수 {stats['score']}%, {stats['frames'] / stats['seconds']:.1f} fps")
+    except KeyboardInterrupt:
+        # 끝난 영상은 이미 기록되어 있으므로 다음 실행에서 나머지만 처리
+        print("\n중단됨: 다시 실행하면 끝나지 않은 영상만 처리합니다.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    elapsed = time.perf_counter() - started
+    print(f"\n처리 완료: 영상 {completed}개, 실패 {failures}개, 작업 프로세스 {workers}개")
+    print(f"총 처리된 프레임: {total_frames} ({elapsed:.1f}초)")
+    print(f"처리 속도: {total_frames / elapsed:.1f} fps, 시간당 영상 {completed / elapsed * 3600:.1f}개")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="디렉토리 또는 목록 파일의 주행 영상을 모두 채점 (중단 후 이어서 실행 가능)")
+    parser.add_argument('source', help="영상 디렉토리, 또는 한 줄에 영상 경로 하나씩 적은 목록 파일")
+    parser.add_argument('output_dir', help="영상별 결과 CSV 와 완료 기록을 쓸 디렉토리")
+    parser.add_argument('--workers', type=int, default=None, help="작업 프로세스 수 (기본: CPU 수)")
+    parser.add_argument('--size', type=parse_size, default=None, help="분석 해상도 WIDTHxHEIGHT (기본: 원본의 1/2)")
+    parser.add_argument('--roi', type=float, default=DEFAULT_ROI_RATIO, help="ROI 높이 비율 (기본: 0.8)")
+    parser.add_argument('--force', action='store_true', help="완료 기록을 무시하고 모두 다시 처리")
+    args = parser.parse_args()
+
+    sys.exit(1 if run_batch(args.source, args.output_dir, args.workers, args.size, args.roi, args.force) else 0)
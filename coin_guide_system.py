@@ -1,20 +1,118 @@
+from functools import lru_cache
+
 import cv2
 import numpy as np
-import math
-#from ar_utils import ARUtils  # AR 관련 유틸리티 클래스
+
+from frame_artifacts import FrameArtifacts
 from lane_detection import ROI_HEIGHT_RATIO  # ROI 전역 변수 import
 
+# 코인 스프라이트 (BGR)
+COIN_COLOR = (0, 215, 255)       # 금색 몸체
+COIN_RIM_COLOR = (0, 160, 210)   # 테두리
+COIN_SHINE_COLOR = (220, 250, 255)  # 광택
+
+# 원근감: 차선 위쪽 끝으로 갈수록 코인이 작아지되 이 크기(픽셀)보다는 작아지지 않음
+MIN_COIN_SIZE = 6
+
+# 크기별로 미리 그려 둘 스프라이트 최대 개수
+MAX_SPRITES = 64
+
+
+@lru_cache(maxsize=MAX_SPRITES)
+def coin_sprite(size):
+    """지름 size 픽셀 코인 스프라이트를 (알파를 곱한 BGR, 255 - 알파) uint16 배열로 반환하는 함수
+
+    크기별로 한 번만 그려서 캐시하는 스프라이트 아틀라스이며, 공유하므로 읽기 전용이다.
+    """
+    # 4 비트 소수점 좌표로 그려서 작은 코인도 중심이 맞도록 함
+    shift = 4
+    center = (((size << shift) - (1 << shift)) // 2,) * 2
+    radius = (size << shift) // 2
+
+    color = np.zeros((size, size, 3), np.uint8)
+    alpha = np.zeros((size, size), np.uint8)
+    cv2.circle(alpha, center, radius, 255, -1, cv2.LINE_AA, shift)
+    cv2.circle(color, center, radius, COIN_RIM_COLOR, -1, cv2.LINE_AA, shift)
+    cv2.circle(color, center, radius * 3 // 4, COIN_COLOR, -1, cv2.LINE_AA, shift)
+    shine = (center[0] - radius // 3, center[1] - radius // 3)
+    cv2.circle(color, shine, max(1 << shift, radius // 4), COIN_SHINE_COLOR, -1, cv2.LINE_AA, shift)
+
+    alpha = alpha.astype(np.uint16)[:, :, None]
+    premultiplied = color * alpha
+    inverse = 255 - alpha
+    premultiplied.flags.writeable = False
+    inverse.flags.writeable = False
+    return premultiplied, inverse
+
+
+def coin_positions(lines, spacing, coin_size, min_size=MIN_COIN_SIZE):
+    """차선마다 아래쪽 끝에서 위쪽 끝까지 spacing 간격으로 코인 위치와 크기를 한 번에 계산하는 함수
+
+    (x, y, size) 정수 배열을 반환한다. 크기는 차선 아래쪽 끝에서 coin_size 이고
+    위쪽 끝 (소실점 방향) 으로 갈수록 선형으로 작아진다.
+    """
+    segments = np.asarray(lines, np.float64).reshape(-1, 4)
+    if not len(segments):
+        empty = np.empty(0, np.intp)
+        return empty, empty, empty
+
+    # 아래쪽 (y 가 큰) 끝에서 출발하도록 정렬
+    flip = segments[:, 1] < segments[:, 3]
+    segments[flip] = segments[flip][:, [2, 3, 0, 1]]
+    x1, y1, x2, y2 = segments.T
+    dx, dy = x2 - x1, y2 - y1
+    length = np.hypot(dx, dy)
+
+    # 차선별 코인 개수만큼 (차선 번호, 차선 안 순번) 을 펼침
+    counts = np.ceil(length / spacing).astype(np.intp)
+    lane = np.repeat(np.arange(len(segments)), counts)
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = step * spacing / length[lane]
+
+    x = x1[lane] + dx[lane] * t
+    y = y1[lane] + dy[lane] * t
+
+    bottom, top = y1.max(), y2.min()
+    depth = (y - top) / (bottom - top) if bottom > top else np.ones_like(y)
+    size = np.maximum(min_size, np.rint(coin_size * depth))
+    return np.rint(x).astype(np.intp), np.rint(y).astype(np.intp), size.astype(np.intp)
+
+
+def blit_coins(frame, xs, ys, sizes):
+    """코인 스프라이트를 (x, y) 중심에 알파 블렌딩으로 그리는 함수 (frame 을 직접 수정)
+
+    코인마다 프레임 안에 들어오는 영역 (ROI) 만 합성한다.
+    """
+    height, width = frame.shape[:2]
+    for x, y, size in zip(xs.tolist(), ys.tolist(), sizes.tolist()):
+        left, top = x - size // 2, y - size // 2
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + size, width), min(top + size, height)
+        if x0 >= x1 or y0 >= y1:
+            continue
+
+        premultiplied, inverse = coin_sprite(size)
+        sprite = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+        roi = frame[y0:y1, x0:x1]
+        # roi * (255 - a) + color * a 는 255 * 255 를 넘지 않으므로 uint16 로 충분
+        blended = roi * inverse[sprite] + premultiplied[sprite]
+        blended += 127
+        roi[:] = blended // 255
+    return frame
+
+
 class SafetyGuideSystem:
     def __init__(self):
-        #self.ar_utils = ARUtils()
         self.coin_spacing = 50  # 코인 간 간격 (픽셀)
-        self.coin_size = 30     # 코인 크기
+        self.coin_size = 30     # 코인 크기 (차선 아래쪽 끝 기준)
+        
+    def detect_lane(self, frame, artifacts=None):
+        """차선 검출 함수 (artifacts 를 주면 다른 검출기와 크기 조정/흑백/에지 결과를 공유)"""
+        artifacts = artifacts or FrameArtifacts(frame)
         
-    def detect_lane(self, frame):
-        """차선 검출 함수"""
         # 이미지 크기 조정
         height, width = frame.shape[:2]
-        frame = cv2.resize(frame, (960, 540))
+        frame = artifacts.resized((960, 540))
         
         # 관심 영역(ROI) 정의
         roi_vertices = np.array([
@@ -28,12 +126,8 @@ class SafetyGuideSystem:
             masked_img = cv2.bitwise_and(img, mask)
             return masked_img
         
-        # 이미지 전처리
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (5, 5), 0)
-        
-        # Canny 엣지 검출
-        edges = cv2.Canny(blur, 50, 150)
+        # 이미지 전처리 (흑백, 블러) 와 Canny 엣지 검출
+        edges = artifacts.edges(50, 150, (5, 5), size=(960, 540))
         
         # ROI 적용
         roi_image = region_of_interest(edges, roi_vertices)
@@ -120,28 +214,12 @@ class SafetyGuideSystem:
         return np.array(adjusted_lines)
     
     def place_coins(self, frame, lines):
-        """차선 끝에 코인 배치"""
-        if lines is None:
+        """차선을 따라 코인 배치 (frame 을 직접 수정)"""
+        if lines is None or not len(lines):
             return frame
             
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            # 차선의 방향 계산
-            angle = math.atan2(y2-y1, x2-x1)
-            
-            # 차선을 따라 코인 배치
-            current_x, current_y = x1, y1
-            while current_x < x2 and current_y < y2:
-                # AR 코인 렌더링
-                frame = self.ar_utils.render_coin(frame, 
-                                                (int(current_x), int(current_y)),
-                                                self.coin_size)
-                
-                # 다음 코인 위치 계산
-                current_x += self.coin_spacing * math.cos(angle)
-                current_y += self.coin_spacing * math.sin(angle)
-                
-        return frame
+        xs, ys, sizes = coin_positions(lines, self.coin_spacing, self.coin_size)
+        return blit_coins(frame, xs, ys, sizes)
     
     def draw_lanes(self, frame, lines):
         """검출된 차선을 프레임에 그리는 함수"""
@@ -193,9 +271,9 @@ class SafetyGuideSystem:
         
         return result
     
-    def process_frame(self, frame):
-        """실시간 프레임 처리"""
-        lines = self.detect_lane(frame)
+    def process_frame(self, frame, artifacts=None):
+        """실시간 프레임 처리 (artifacts: 같은 프레임을 처리하는 다른 검출기와 공유할 FrameArtifacts)"""
+        lines = self.detect_lane(frame, artifacts)
         
         # 차선 그리기
         frame_with_lanes = self.draw_lanes(frame, lines)
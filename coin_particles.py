@@ -0,0 +1,112 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# 코인 움직임 (lane_detection 의 예전 Coin 클래스와 동일)
+COIN_SPAWN_SIZE = 10    # 생성될 때 크기 (반지름)
+COIN_SPEED = 5          # 프레임마다 아래로 내려오는 속도
+COIN_GROWTH = 0.5       # 프레임마다 커지는 크기 (원근감)
+COIN_MAX_SIZE = 25
+
+# 코인 색상 (BGR)
+COIN_COLOR = (0, 255, 255)          # 노란색 몸체
+COIN_HIGHLIGHT_COLOR = (255, 255, 255)  # 광택
+
+
+@lru_cache(maxsize=COIN_MAX_SIZE + 1)
+def coin_sprite(radius):
+    """반지름 radius 코인을 (BGR, 마스크, 중심에서 왼쪽 위 모서리까지 거리) 로 미리 그려 두는 함수
+
+    cv2.circle 두 번 (몸체와 광택) 으로 그린 결과와 같은 픽셀이며, 정수 크기별로 한 번만 만든다.
+    공유하므로 읽기 전용이다.
+    """
+    offset = radius // 3
+    highlight = max(2, offset)
+    extent = max(radius, offset + highlight)
+    side = 2 * extent + 1
+
+    sprite = np.zeros((side, side, 3), np.uint8)
+    mask = np.zeros((side, side), np.uint8)
+    center = (extent, extent)
+    shine = (extent - offset, extent - offset)
+    for image, body, gloss in ((sprite, COIN_COLOR, COIN_HIGHLIGHT_COLOR), (mask, 255, 255)):
+        cv2.circle(image, center, radius, body, -1)
+        cv2.circle(image, shine, highlight, gloss, -1)
+
+    sprite.flags.writeable = False
+    mask.flags.writeable = False
+    return sprite, mask, extent
+
+
+class CoinField:
+    """화면의 코인들을 (x, y, size) 병렬 배열로 보관하는 파티클 집합
+
+    예전의 Coin 객체 리스트 대신 프레임마다 한 번의 배열 연산으로 움직이고,
+    화면을 벗어난 코인은 불리언 마스크로 한 번에 제거한다.
+    """
+
+    def __init__(self):
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.size = np.empty(0)
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def nbytes(self):
+        return self.x.nbytes + self.y.nbytes + self.size.nbytes
+
+    def spawn(self, x, y, size=COIN_SPAWN_SIZE):
+        """(x, y) 에 코인 하나를 추가하는 함수"""
+        self.x = np.append(self.x, x)
+        self.y = np.append(self.y, y)
+        self.size = np.append(self.size, size)
+
+    def step(self, slope, height):
+        """모든 코인을 아래로 움직이면서 차선 기울기만큼 x 도 옮기고, 화면 아래로 나간 코인은 버리는 함수"""
+        self.y += COIN_SPEED
+        self.x += COIN_SPEED * slope
+        np.minimum(self.size + COIN_GROWTH, COIN_MAX_SIZE, out=self.size)
+
+        inside = self.y < height
+        if not inside.all():
+            self.x, self.y, self.size = self.x[inside], self.y[inside], self.size[inside]
+
+    def draw(self, image):
+        """코인을 생성된 순서대로 image 에 그리는 함수 (미리 그린 스프라이트를 화면 안쪽 영역만 복사)"""
+        height, width = image.shape[:2]
+        xs = self.x.astype(np.intp)
+        ys = self.y.astype(np.intp)
+        radii = self.size.astype(np.intp)
+
+        # 광택 중심은 예전처럼 int(x - size // 3) 로 자르므로 (0 쪽으로 버림),
+        # 화면 왼쪽/위쪽 밖에서 스프라이트 안의 광택 위치와 한 픽셀 어긋나는 코인은 직접 그린다
+        offsets = radii // 3
+        shine_xs = (self.x - offsets).astype(np.intp)
+        shine_ys = (self.y - offsets).astype(np.intp)
+        shifted = (shine_xs != xs - offsets) | (shine_ys != ys - offsets)
+
+        for x, y, radius, shine_x, shine_y, direct in zip(xs.tolist(), ys.tolist(), radii.tolist(),
+                                                          shine_xs.tolist(), shine_ys.tolist(), shifted.tolist()):
+            if direct:
+                cv2.circle(image, (x, y), radius, COIN_COLOR, -1)
+                cv2.circle(image, (shine_x, shine_y), max(2, radius // 3), COIN_HIGHLIGHT_COLOR, -1)
+                continue
+
+            sprite, mask, extent = coin_sprite(radius)
+            left, top = x - extent, y - extent
+            x0, y0 = max(left, 0), max(top, 0)
+            x1, y1 = min(left + sprite.shape[1], width), min(top + sprite.shape[0], height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            region = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+            cv2.copyTo(sprite[region], mask[region], image[y0:y1, x0:x1])
+        return image
+
+    def clear(self):
+        """모든 코인을 지우는 함수"""
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.size = np.empty(0)
@@ -1,210 +1,269 @@
+import os
 import cv2
 import numpy as np
 import json
 
+from frame_quality import check_frame_quality
+from lane_analyzer import LaneAnalyzer, lane_outline, lane_outlines, outline_centered
+from lane_birdseye import BirdsEyeAnalyzer
+from lane_session import LaneSession
+from stage_profiler import PROFILER
+from lane_scanline import ScanlineAnalyzer
+
 # 전역 변수 설정
 ROI_HEIGHT_RATIO = 0.6  # 기본값 0.8 (80%)
 
-def canny(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    # 점선을 더 잘 감지하기 위한 전처리
-    # 1. 가우시안 블러 강화
-    blur = cv2.GaussianBlur(gray, (7, 7), 0)
-    
-    # 2. 이미지 개선을 위한 CLAHE 적용
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    enhanced = clahe.apply(blur)
-    
-    # 3. 모폴로지 연산으로 점선 연결
-    kernel = np.ones((5,5), np.uint8)
-    dilated = cv2.dilate(enhanced, kernel, iterations=1)
-    eroded = cv2.erode(dilated, kernel, iterations=1)
-    
-    # 4. 캐니 엣지 파라미터 조정
-    canny = cv2.Canny(eroded, 30, 150)  # 낮은 임계값으로 조정
-    
-    return canny
-
-def region_of_interest(image):
-    height = image.shape[0]
-    width = image.shape[1]
-    
-    bottom_padding = 0
-    roi_height = int(height * (1 - ROI_HEIGHT_RATIO))  # ROI_HEIGHT_RATIO에 맞춰 조정
-    
-    polygons = np.array([
-        [(50, height-bottom_padding), 
-         (width-50, height-bottom_padding), 
-         (width-100, height-roi_height), 
-         (100, height-roi_height)]
-    ])
-    mask = np.zeros_like(image)
-    cv2.fillPoly(mask, polygons, 255)
-    masked_image = cv2.bitwise_and(image, mask)
-    return masked_image
-
-def merge_close_lines(lines, min_distance=50):
-    """가까운 선들을 하나로 합치는 함수"""
-    if lines is None or len(lines) < 2:
-        return lines
-        
-    merged_lines = []
-    used = [False] * len(lines)
-    
-    for i in range(len(lines)):
-        if used[i]:
-            continue
-            
-        current_line = lines[i][0]
-        x1, y1, x2, y2 = current_line
-        x_avg = (x1 + x2) / 2
-        
-        # 현재 선과 가까운 다른 선들을 찾아서 평균 계산
-        close_lines = [current_line]
-        used[i] = True
-        
-        for j in range(i + 1, len(lines)):
-            if used[j]:
-                continue
-                
-            other_line = lines[j][0]
-            ox1, oy1, ox2, oy2 = other_line
-            other_x_avg = (ox1 + ox2) / 2
-            
-            # x 좌표의 평균값 차이로 거리 계산
-            if abs(x_avg - other_x_avg) < min_distance:
-                close_lines.append(other_line)
-                used[j] = True
-        
-        if len(close_lines) >= 1:
-            # 가까운 선들의 평균 계산
-            avg_line = np.mean(close_lines, axis=0)
-            merged_lines.append(np.array([avg_line], dtype=np.int32))
-    
-    return merged_lines if merged_lines else None
-
-class Coin:
-    def __init__(self, x, y, size=10):
-        self.x = x
-        self.y = y
-        self.size = size
-        self.speed = 5  # 코인이 아래로 내려오는 속도
-
-    def update(self, slope):
-        # 코인을 아래로 이동하면서 차선 기울기에 따라 x좌표도 조정
-        self.y += self.speed
-        self.x += self.speed * slope
-        # 크기도 점점 커지게 (원근감)
-        self.size = min(25, self.size + 0.5)
-
-def analyze_frame(frame):
+# 작업 해상도 (width, height): 지정하면 모든 프레임의 긴 변을 이 크기의 긴 변에 맞춰 분석한다
+# (가로세로 비율은 유지, 가로/세로에 같은 배율을 써야 기울기와 차선 폭 검사가 입력과 관계없이 같다)
+# 임계값(minLineLength, 차선 폭 등)은 이 해상도 기준이 되고, road_outline 은 원래 좌표로 되돌린다
+# None 이면 입력 해상도 그대로 분석
+WORKING_SIZE = None
+
+# 검출 전에 어둡거나 흔들린 프레임을 걸러낼지 여부 (frame_quality.check_frame_quality)
+QUALITY_CHECKS = True
+
+# 서버 시작 시 미리 준비할 해상도 (width, height)
+WARMUP_SIZES = [(960, 540), (1280, 720)]
+WARMUP_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'input', 'test_image.jpg')
+
+# 차선 검출 엔진
+# "hough": Canny + HoughLinesP + 선분 병합 (lane_analyzer)
+# "birdseye": 원근 변환 + 열 히스토그램 + 슬라이딩 윈도우 (lane_birdseye)
+# "scanline": 고정 스캔라인의 1차원 에지 + 최소제곱 직선 (lane_scanline, 과부하 시 사용)
+ENGINES = ("hough", "birdseye", "scanline")
+ENGINE = "hough"
+
+# 해상도별 계획을 재사용하는 차선 검출 엔진
+_analyzer = LaneAnalyzer()
+_birdseye = BirdsEyeAnalyzer()
+_scanline = ScanlineAnalyzer()
+
+# session 을 주지 않고 호출할 때 쓰는 세션 (단일 스트림 스크립트용)
+_default_session = LaneSession()
+
+def set_working_resolution(size):
+    """작업 해상도를 설정하는 함수 (None 이면 원본 해상도로 분석)"""
+    global WORKING_SIZE
+    WORKING_SIZE = tuple(size) if size else None
+
+def set_preprocess_profile(profile):
+    """hough 엔진의 전처리 프로파일을 설정하는 함수 (lane_analyzer.PROFILES 중 하나)"""
+    global _analyzer
+    _analyzer = LaneAnalyzer(profile=profile)
+
+def set_engine(name):
+    """차선 검출 엔진을 선택하는 함수 (ENGINES 중 하나)"""
+    global ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown lane engine: {name!r} (expected one of {ENGINES})")
+    ENGINE = name
+
+def set_quality_checks(enabled):
+    """검출 전 품질 검사를 켜거나 끄는 함수"""
+    global QUALITY_CHECKS
+    QUALITY_CHECKS = bool(enabled)
+
+def frame_reject_reason(frame):
+    """분석할 수 없는 프레임이면 거부 사유 문자열을, 아니면 None 을 반환하는 함수"""
+    if not QUALITY_CHECKS:
+        return None
+    reason = check_frame_quality(frame, ROI_HEIGHT_RATIO)
+    return reason.value if reason is not None else None
+
+def working_frame_size(width, height):
+    """(width, height) 프레임을 작업 해상도 모드에서 분석할 크기와 원래 좌표로 되돌릴 배율 (scale) 을 반환하는 함수"""
+    if WORKING_SIZE is None:
+        return (width, height), 1.0
+    scale = max(width, height) / max(WORKING_SIZE)
+    return (max(1, round(width / scale)), max(1, round(height / scale))), scale
+
+def to_working_resolution(frame):
+    """작업 해상도 모드면 프레임의 긴 변을 작업 해상도에 맞추고 (frame, scale) 를 반환하는 함수"""
+    height = frame.shape[0]
+    width = frame.shape[1]
+    size, scale = working_frame_size(width, height)
+    if size == (width, height):
+        return frame, 1.0
+    
+    interpolation = cv2.INTER_AREA if scale > 1 else cv2.INTER_LINEAR
+    return cv2.resize(frame, size, interpolation=interpolation), scale
+
+def detect_outline(frame, corridor=None, engine=None):
+    """엔진 (None 이면 ENGINE) 으로 작업 해상도 프레임의 road_outline dict 를 구하는 함수 (찾지 못하면 None)
+
+    corridor (이전 차선 주변 영역) 는 hough 엔진에서만 사용한다.
+    """
+    height = frame.shape[0]
+    width = frame.shape[1]
+    engine = engine or ENGINE
+    if engine == "birdseye":
+        return _birdseye.detect_outline(frame, ROI_HEIGHT_RATIO)
+    if engine == "scanline":
+        return _scanline.detect_outline(frame, ROI_HEIGHT_RATIO)
+    lines = _analyzer.detect_lines(frame, ROI_HEIGHT_RATIO, corridor)
+    return lane_outline(lines, height, width, ROI_HEIGHT_RATIO)
+
+def outline_result(result, outline, width, scale):
+    """road_outline 과 점수를 원래 좌표로 되돌려 결과 dict 에 기록하는 함수"""
+    result["road_outline"] = {
+        "bottom_x_r": float(outline["bottom_x_r"] * scale),
+        "bottom_x_s": float(outline["bottom_x_s"] * scale),
+        "bottom_y": float(outline["bottom_y"] * scale),
+        "top_x_r": float(outline["top_x_r"] * scale),
+        "top_x_s": float(outline["top_x_s"] * scale),
+        "top_y": float(outline["top_y"] * scale)
+    }
+    result["score"] = 100.0 if outline_centered(outline, width) else 0.0
+
+def analyze_frame(frame, engine=None, session=None):
     """한 프레임을 분석하여 차선 정보와 점수를 JSON 형식으로 반환하는 함수"""
+    return analyze_frames([frame], engine, session)[0]
+
+def analyze_frames(frames, engine=None, session=None):
+    """여러 프레임을 한 번에 분석하여 프레임별 결과 리스트를 반환하는 함수
+    
+    frames 는 (N, H, W, 3) 배열 또는 프레임 iterable 이다.
+    OpenCV 검출은 프레임마다 수행하고, 이후의 선분 필터링/병합/차선 선택/외삽은
+    모든 프레임의 선분을 모아 배열 연산으로 한 번에 처리한다 (lane_analyzer.lane_outlines).
+    결과는 analyze_frame 을 N 번 호출한 것과 같다.
+    engine 은 ENGINES 중 하나 (None 이면 ENGINE) 이며,
+    birdseye/scanline 엔진이면 프레임마다 road_outline 을 바로 구한다.
+    품질 검사에 걸린 프레임은 검출을 건너뛰고 "reject_reason" 에 사유를 남긴다.
+    session (LaneSession) 에 프레임 수를 기록한다 (None 이면 모듈 기본 세션).
+    """
+    session = session or _default_session
+    engine = engine or ENGINE
+    timer = PROFILER.timer()
+    
+    # 1. 프레임별 차선 검출 (CLAHE, 커널, ROI 마스크, 버퍼는 해상도별로 재사용)
+    segments = []
+    segment_ids = []
+    sizes = []
+    scales = []
+    reasons = []
+    outlines = {}
+    for index, frame in enumerate(frames):
+        frame, scale = to_working_resolution(frame)
+        sizes.append(frame.shape[:2])
+        scales.append(scale)
+        timer.mark("resize")
+        reasons.append(frame_reject_reason(frame))
+        timer.mark("quality")
+        if reasons[-1] is not None:
+            continue
+        if engine != "hough":
+            outlines[index] = detect_outline(frame, engine=engine)
+            timer.mark(engine)
+            continue
+        lines = _analyzer.detect_lines(frame, ROI_HEIGHT_RATIO)
+        timer.skip()  # 검출 단계별 시간은 LaneAnalyzer 가 기록
+        if lines is not None:
+            segments.append(lines[:, 0])
+            segment_ids.append(np.full(len(lines), index))
+    
+    n_frames = len(sizes)
+    session.frame_count += n_frames
     
     # 결과를 저장할 딕셔너리
-    result = {
+    results = [{
         "score": None,
         "frame_id": 0,
         "road_outline": None,
-    }
+        "reject_reason": reason,
+    } for reason in reasons]
+    for i, outline in outlines.items():
+        if outline is not None:
+            outline_result(results[i], outline, sizes[i][1], scales[i])
+    if not segments:
+        timer.mark("postprocess")
+        timer.done()
+        return results
     
-    # static 변수로 coins 리스트와 frame_count 관리
-    if not hasattr(analyze_frame, 'frame_count'):
-        analyze_frame.frame_count = 0
+    heights, widths = np.array(sizes).T
+    segments = np.concatenate(segments)
+    segment_ids = np.concatenate(segment_ids)
     
-    analyze_frame.frame_count += 1
+    # 2. 필터링/병합/차선 선택/외삽을 모든 프레임에 대해 배열 연산으로 수행
+    valid, outline = lane_outlines(segments, segment_ids, heights, widths, ROI_HEIGHT_RATIO)
     
+    # road_outline 정보 업데이트 및 점수 계산
+    for i in np.flatnonzero(valid):
+        frame_outline = {key: value[i] for key, value in outline.items()}
+        outline_result(results[i], frame_outline, widths[i], scales[i])
+    timer.mark("postprocess")
+    timer.done()
+    return results
+
+def track_frame(frame, tracker, engine=None):
+    """차선 추적기(LaneTracker)를 사용해 한 프레임을 분석하는 함수
+    
+    추적기가 예측을 신뢰할 수 없다고 판단할 때만 검출을 수행하고, 나머지 프레임은 예측값을 쓴다.
+    결과는 analyze_frame 과 같은 형식이며, 이번 프레임에 전체 검출을 했는지 "detected" 로 표시한다.
+    검출할 차례인데 품질 검사에 걸리면 검출 실패로 처리한다 (추적기는 예측을 유지).
+    """
+    frame, scale = to_working_resolution(frame)
     height = frame.shape[0]
     width = frame.shape[1]
     
-    # 차선 검출
-    canny_image = canny(frame)
-    cropped_image = region_of_interest(canny_image)
-    
-    kernel = np.ones((3,15), np.uint8)
-    processed = cv2.dilate(cropped_image, kernel, iterations=1)
-    processed = cv2.erode(processed, kernel, iterations=1)
-    lines = cv2.HoughLinesP(
-        processed,
-        rho=1,
-        theta=np.pi/180,
-        threshold=40,
-        minLineLength=35,
-        maxLineGap=100
-    )
-    # 차선 분석
-    if lines is not None:
-        # 기울기로 필터링된 선들
-        filtered_lines = []
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            if y1 < height * ROI_HEIGHT_RATIO or y2 < height * ROI_HEIGHT_RATIO:
-                continue
-            
-            if x2 != x1:
-                slope = (y2 - y1) / (x2 - x1)
-                if (slope > 0.05) or slope < -0.5:
-                    filtered_lines.append(line)
-        
-        # 가까운 선들 병합
-        right_lines = []
-        if filtered_lines:
-            merged_lines = merge_close_lines(filtered_lines)
-            if merged_lines is not None:
-                for line in merged_lines:
-                    x1, y1, x2, y2 = line[0]
-                    x_avg = (x1 + x2) / 2
-                    right_lines.append((line[0], x_avg))
-        
-        # 차선 정보 추출
-        if len(right_lines) >= 2:
-            right_lines.sort(key=lambda x: x[1], reverse=True)
-            right_most_line = right_lines[0][0]
-            second_right_line = right_lines[1][0]
-            
-            x1_r, y1_r, x2_r, y2_r = right_most_line
-            x1_s, y1_s, x2_s, y2_s = second_right_line
-            
-            if y2_r != y1_r and y2_s != y1_s:
-                slope_r = (x2_r - x1_r) / (y2_r - y1_r)
-                slope_s = (x2_s - x1_s) / (y2_s - y1_s)
-                
-                steep_enough = abs(slope_r) > 0.5 and abs(slope_s) > 0.5
-                
-                bottom_y = height - 30
-                top_y = height * ROI_HEIGHT_RATIO
-                
-                bottom_x_r = x1_r + slope_r * (bottom_y - y1_r)
-                bottom_x_s = x1_s + slope_s * (bottom_y - y1_s)
-                top_x_r = x1_r + slope_r * (top_y - y1_r)
-                top_x_s = x1_s + slope_s * (top_y - y1_s)
-                
-                # 차선 간격 계산
-                lane_width = abs(bottom_x_r - bottom_x_s)
-                
-                # 중앙선 좌표 계산
-                center_x = width / 2
-                
-                # 차선 간격이 충분히 넓고 기울기가 충분할 때
-                if lane_width > 100 and steep_enough and lane_width < 500:
-                    # road_outline 정보 업데이트
-                    result["road_outline"] = {
-                        "bottom_x_r": float(bottom_x_r),
-                        "bottom_x_s": float(bottom_x_s),
-                        "bottom_y": float(bottom_y),
-                        "top_x_r": float(top_x_r),
-                        "top_x_s": float(top_x_s),
-                        "top_y": float(top_y)
-                    }
-                    
-                    # 점수 계산
-                    if (min(bottom_x_r, bottom_x_s) <= center_x <= max(bottom_x_r, bottom_x_s) or
-                        min(top_x_r, top_x_s) <= center_x <= max(top_x_r, top_x_s)):
-                        result["score"] = 100.0
-                    else:
-                        result["score"] = 0.0
+    # 추적이 안정되면 예측된 차선 주변에서만 검출 (찾지 못하면 다음 검출은 ROI 전체에서)
+    tracker.predict()
+    detected = tracker.needs_detection()
+    reason = None
+    if detected:
+        reason = frame_reject_reason(frame)
+        if reason is not None:
+            detected = False
+            tracker.update(None)
+        else:
+            # corridor 는 hough 엔진에서만 사용
+            corridor = tracker.corridor(height, width) if (engine or ENGINE) == "hough" else None
+            outline = detect_outline(frame, corridor, engine)
+            tracker.update(outline)
+    
+    result = {
+        "score": None,
+        "frame_id": 0,
+        "road_outline": None,
+        "detected": detected,
+        "reject_reason": reason,
+    }
+    outline = tracker.outline()
+    if outline is not None:
+        outline_result(result, outline, width, scale)
     return result
 
+def analyze_frame_gated(frame, gate, analyze=analyze_frame):
+    """변화 감지기(MotionGate)를 거쳐 한 프레임을 분석하는 함수
+    
+    직전에 분석한 프레임과 거의 같으면 분석을 건너뛰고 이전 결과를 "reused": True 로 표시해서 반환한다.
+    analyze 에는 analyze_frame 또는 추적기를 묶은 함수 (예: lambda f: track_frame(f, tracker)) 를 줄 수 있다.
+    """
+    previous = gate.check(frame)
+    if previous is not None:
+        return dict(previous, reused=True)
+    
+    result = analyze(frame)
+    gate.store(result)
+    return dict(result, reused=False)
+
+def warmup_analyzer(sample_path=WARMUP_IMAGE, sizes=WARMUP_SIZES):
+    """샘플 이미지로 분석기를 미리 준비하는 함수 (첫 요청의 초기화 비용 제거)"""
+    sample = cv2.imread(sample_path) if sample_path else None
+    if sample is None:
+        width, height = sizes[0] if sizes else (960, 540)
+        sample = np.zeros((height, width, 3), np.uint8)
+    
+    # 작업 해상도 모드에서는 작업 해상도 계획만 있으면 된다
+    if WORKING_SIZE is not None:
+        sample = to_working_resolution(sample)[0]
+        sizes = ()
+    engine = {"hough": _analyzer, "birdseye": _birdseye, "scanline": _scanline}[ENGINE]
+    engine.warmup(sample, ROI_HEIGHT_RATIO, sizes)
+    
+    # 과부하 시 전환할 scanline 엔진도 준비
+    if ENGINE != "scanline":
+        _scanline.warmup(sample, ROI_HEIGHT_RATIO, sizes)
+
 def process_single_frame(frame_path):
     """이미지 파일을 읽어서 분석하는 함수"""
     frame = cv2.imread(frame_path)
@@ -0,0 +1,82 @@
+import cv2
+
+
+class FrameArtifacts:
+    """프레임 하나의 중간 결과 (크기 조정, 흑백, 블러, 에지) 를 처음 요청될 때 한 번만 계산해서 공유하는 캐시
+
+    SafetyGuideSystem.detect_lane 과 LaneAnalyzer.detect_lines 처럼 같은 프레임에서 비슷한 전처리를
+    각자 하던 검출기들이 같은 객체를 받으면, 겹치는 단계 (특히 크기 조정과 흑백 변환) 는 한 번만 수행한다.
+    size 는 (width, height) 이고 None 이거나 원본과 같으면 원본 크기를 뜻한다.
+    반환되는 배열은 다른 검출기와 공유하므로 호출하는 쪽에서 수정하면 안 된다.
+    프레임마다 새로 만들어서 쓰고, 한 스레드 안에서만 사용한다 (잠금 없음).
+    원본 frame 을 직접 수정하는 쪽 (lane_detection.render_frame 의 오버레이 합성 등) 은 수정하기 전에
+    detach() 를 호출해야 다른 검출기가 수정된 픽셀을 보지 않는다.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._cache = {}
+
+        # 통계 (캐시에서 바로 돌려준 횟수 / 새로 계산한 횟수)
+        self.hits = 0
+        self.misses = 0
+
+    def detach(self):
+        """frame 을 직접 수정하기 전에 원본을 복사해 두는 함수 (이후 결과는 복사본에서 계산)"""
+        original = self.frame
+        self.frame = original.copy()
+        for key, value in self._cache.items():
+            if value is original:
+                self._cache[key] = self.frame
+
+    def _size(self, size):
+        """원본과 같은 크기는 None 으로 통일하는 함수 (같은 단계를 다른 키로 두 번 계산하지 않도록)"""
+        if size is None:
+            return None
+        width, height = size
+        if (height, width) == self.frame.shape[:2]:
+            return None
+        return int(width), int(height)
+
+    def _get(self, key, compute):
+        value = self._cache.get(key)
+        if value is None:
+            value = compute()
+            self._cache[key] = value
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def resized(self, size=None):
+        """size 로 크기를 조정한 프레임"""
+        size = self._size(size)
+        if size is None:
+            return self.frame
+        return self._get(("resized", size), lambda: cv2.resize(self.frame, size))
+
+    def gray(self, size=None):
+        """size 에서의 흑백 영상 (입력이 이미 흑백이면 그대로)"""
+        size = self._size(size)
+
+        def compute():
+            image = self.resized(size)
+            if image.ndim == 2:
+                return image
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        return self._get(("gray", size), compute)
+
+    def blurred(self, ksize, size=None):
+        """size 에서의 흑백 영상에 ksize 가우시안 블러를 적용한 영상"""
+        size = self._size(size)
+        ksize = tuple(ksize)
+        return self._get(("blurred", ksize, size),
+                         lambda: cv2.GaussianBlur(self.gray(size), ksize, 0))
+
+    def edges(self, low, high, ksize, size=None):
+        """size 에서의 blurred() 영상에 대한 Canny 에지"""
+        size = self._size(size)
+        ksize = tuple(ksize)
+        return self._get(("edges", low, high, ksize, size),
+                         lambda: cv2.Canny(self.blurred(ksize, size), low, high))
@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+
+# 업로드 상한 (이보다 크면 디코딩하지 않고 거부)
+MAX_FRAME_BYTES = 8 * 1024 ** 2
+MAX_FRAME_PIXELS = 3840 * 2160
+
+# 해상도를 줄여서 디코딩하는 흑백 플래그 (축소 배율별)
+REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# 크기 정보가 들어 있는 JPEG SOF 마커 (C4: DHT, C8: JPG 확장, CC: DAC 는 제외)
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# 길이 필드가 없는 JPEG 마커 (TEM, RST0~7)
+STANDALONE_MARKERS = frozenset([0x01, *range(0xD0, 0xD8)])
+
+# PNG 시그니처 (바로 뒤에 크기가 들어 있는 IHDR 청크가 온다)
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class FrameDecodeError(ValueError):
+    """업로드된 프레임을 디코딩하지 않고 거부할 때 발생하는 예외"""
+
+
+def jpeg_dimensions(data):
+    """JPEG 헤더만 읽어서 (width, height, 채널 수) 를 반환하는 함수 (JPEG 가 아니거나 헤더가 깨졌으면 FrameDecodeError)"""
+    if data[:2] != b'\xff\xd8':
+        raise FrameDecodeError("Frame is not a JPEG image")
+
+    index = 2
+    size = len(data)
+    while index + 4 <= size:
+        if data[index] != 0xFF:
+            raise FrameDecodeError("Malformed JPEG header")
+        marker = data[index + 1]
+        if marker == 0xFF:  # 채움 바이트
+            index += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            index += 2
+            continue
+        if marker in (0xD9, 0xDA):  # 크기 정보 전에 이미지 끝 / 스캔 시작
+            break
+
+        length = int.from_bytes(data[index + 2:index + 4], 'big')
+        if length < 2:
+            raise FrameDecodeError("Malformed JPEG header")
+        if marker in SOF_MARKERS:
+            if length < 8 or index + 2 + length > size:
+                raise FrameDecodeError("Truncated JPEG header")
+            height = int.from_bytes(data[index + 5:index + 7], 'big')
+            width = int.from_bytes(data[index + 7:index + 9], 'big')
+            components = data[index + 9]
+            if not width or not height or components not in (1, 3):
+                raise FrameDecodeError("Unsupported JPEG dimensions")
+            return width, height, components
+        index += 2 + length
+
+    raise FrameDecodeError("JPEG header has no frame size")
+
+
+def png_dimensions(data):
+    """PNG 헤더 (IHDR 청크) 만 읽어서 (width, height) 를 반환하는 함수 (PNG 가 아니거나 헤더가 깨졌으면 FrameDecodeError)"""
+    if data[:8] != PNG_SIGNATURE:
+        raise FrameDecodeError("Frame is not a PNG image")
+    if len(data) < 24 or data[12:16] != b'IHDR':
+        raise FrameDecodeError("Malformed PNG header")
+    width = int.from_bytes(data[16:20], 'big')
+    height = int.from_bytes(data[20:24], 'big')
+    if not width or not height:
+        raise FrameDecodeError("Unsupported PNG dimensions")
+    return width, height
+
+
+def reduction_factor(width, height, working_size):
+    """긴 변이 작업 해상도의 긴 변보다 작아지지 않는 가장 큰 디코딩 축소 배율 (작업 해상도가 없으면 1)
+
+    frame_analyzer 는 프레임의 긴 변을 작업 해상도의 긴 변에 맞추므로 (가로세로 비율 유지) 같은 기준을 쓴다.
+    """
+    if working_size is None:
+        return 1
+    for factor in sorted(REDUCED_GRAYSCALE, reverse=True):
+        # 축소 디코딩 결과 크기는 올림
+        if -(-max(width, height) // factor) >= max(working_size):
+            return factor
+    return 1
+
+
+def decode_frame(data, working_size=None, max_bytes=MAX_FRAME_BYTES, max_pixels=MAX_FRAME_PIXELS):
+    """업로드된 프레임을 분석용 흑백 프레임으로 디코딩해서 (frame, 축소 배율) 을 반환하는 함수
+
+    JPEG/PNG 는 헤더에서 크기를 먼저 확인해 너무 크거나 깨진 업로드를 디코딩 전에 FrameDecodeError 로 거부하고,
+    working_size (width, height) 를 주면 긴 변이 그 긴 변보다 작아지지 않는 범위에서 축소 디코딩한다
+    (IMREAD_REDUCED_GRAYSCALE_2/4/8, JPEG 만). 디코딩 전에 크기를 알 수 없는 다른 형식은 거부한다.
+    분석 결과 좌표에 축소 배율을 곱하면 업로드 원본 좌표가 된다. imdecode 가 EXIF 방향을 적용해
+    가로/세로가 바뀌어도 두 축의 배율은 같으므로, 헤더의 크기 대신 배율로 되돌린다.
+    """
+    if len(data) > max_bytes:
+        raise FrameDecodeError(f"Frame upload is larger than {max_bytes} bytes")
+
+    if data[:2] == b'\xff\xd8':
+        width, height, _ = jpeg_dimensions(data)
+        if width * height > max_pixels:
+            raise FrameDecodeError(f"Frame is {width}x{height}, larger than {max_pixels} pixels")
+        factor = reduction_factor(width, height, working_size)
+    elif data[:8] == PNG_SIGNATURE:
+        # PNG 는 축소 디코딩해도 원본 크기로 디코딩한 뒤 줄이므로 이득이 없다
+        width, height = png_dimensions(data)
+        if width * height > max_pixels:
+            raise FrameDecodeError(f"Frame is {width}x{height}, larger than {max_pixels} pixels")
+        factor = 1
+    else:
+        raise FrameDecodeError("Unsupported frame format (expected JPEG or PNG)")
+
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), REDUCED_GRAYSCALE[factor])
+    if frame is None:
+        raise FrameDecodeError("Failed to decode frame")
+    if frame.shape[0] * frame.shape[1] > max_pixels:
+        raise FrameDecodeError(f"Frame is {frame.shape[1]}x{frame.shape[0]}, larger than {max_pixels} pixels")
+    return frame, factor
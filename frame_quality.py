@@ -0,0 +1,59 @@
+from enum import Enum
+
+import cv2
+import numpy as np
+
+# 품질 검사용 축소 ROI 너비 (높이는 비율 유지)
+CHECK_WIDTH = 160
+
+# 검사 임계값 (CHECK_WIDTH 로 줄인 흑백 ROI 기준)
+DARK_MEAN = 30.0            # 평균 밝기가 이보다 낮으면 너무 어두움
+BRIGHT_MEAN = 225.0         # 평균 밝기가 이보다 높으면 과다 노출
+MIN_CONTRAST = 6.0          # 밝기 표준편차가 이보다 낮으면 하늘/벽처럼 밋밋한 장면
+MIN_SHARPNESS = 150.0       # 라플라시안 분산이 이보다 낮으면 흔들림/초점 흐림
+MIN_EDGE_DENSITY = 0.005    # 캐니 엣지 픽셀 비율이 이보다 낮으면 차선 후보 없음
+
+
+class RejectReason(str, Enum):
+    """분석을 조기에 끝낸 이유 (JSON 에는 문자열 값으로 들어감)"""
+    TOO_DARK = "too_dark"
+    OVEREXPOSED = "overexposed"
+    LOW_CONTRAST = "low_contrast"
+    BLURRED = "blurred"
+    NO_EDGES = "no_edges"
+
+
+def check_frame_quality(frame, roi_ratio):
+    """싼 검사부터 차례로 수행해서 분석할 수 없는 프레임이면 RejectReason 을, 아니면 None 을 반환하는 함수
+
+    1. 축소한 ROI 의 평균/표준편차 (너무 어두움, 과다 노출, 밋밋함)
+    2. 라플라시안 분산 (흔들림)
+    3. 캐니 엣지 밀도 (차선 후보 없음)
+    """
+    height, width = frame.shape[:2]
+    top = int(height * roi_ratio)
+    check_height = max(1, round(CHECK_WIDTH * (height - top) / width))
+    small = cv2.resize(frame[top:], (CHECK_WIDTH, check_height), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    # 1. 밝기
+    mean, std = cv2.meanStdDev(small)
+    mean, std = mean[0, 0], std[0, 0]
+    if mean < DARK_MEAN:
+        return RejectReason.TOO_DARK
+    if mean > BRIGHT_MEAN:
+        return RejectReason.OVEREXPOSED
+    if std < MIN_CONTRAST:
+        return RejectReason.LOW_CONTRAST
+
+    # 2. 선명도
+    laplacian = cv2.Laplacian(small, cv2.CV_16S)
+    if cv2.meanStdDev(laplacian)[1][0, 0] ** 2 < MIN_SHARPNESS:
+        return RejectReason.BLURRED
+
+    # 3. 엣지 밀도
+    edges = cv2.Canny(small, 30, 150)
+    if np.count_nonzero(edges) < MIN_EDGE_DENSITY * edges.size:
+        return RejectReason.NO_EDGES
+    return None
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+# 프레임 저장소 메타데이터 형식 버전
+STORE_VERSION = 1
+
+# 프레임 수를 알 수 없을 때 처음 잡는 저장소 크기 (모자라면 두 배씩 늘림)
+INITIAL_CAPACITY = 256
+
+
+class FrameStoreError(ValueError):
+    """프레임 저장소가 없거나, 만드는 중에 중단되었거나, 형식이 맞지 않을 때 발생하는 예외"""
+
+
+def sidecar_path(store_path):
+    """프레임 저장소 (.npy) 의 메타데이터 파일 경로 (<이름>.json)"""
+    return os.path.splitext(store_path)[0] + '.json'
+
+
+def _write_json(path, data):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def build_frame_store(video_path, store_path, size=None, grayscale=False):
+    """영상을 한 번 디코딩해서 (프레임 수, 높이, 너비[, 3]) uint8 .npy 저장소와 메타데이터 파일로 쓰는 함수
+
+    size (width, height) 를 주면 그 크기로 바꿔서, grayscale=True 이면 흑백으로 저장한다
+    (분석기와 같은 순서로 크기 조정 후 흑백 변환). 저장소는 np.lib.format.open_memmap 으로
+    디스크에 바로 쓰므로 영상 전체를 메모리에 올리지 않는다.
+    메타데이터는 저장소를 다 쓴 뒤에 마지막으로 쓰므로, 메타데이터가 있으면 저장소는 완성된 것이다.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video source: {video_path!r}")
+    if size is None:
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    width, height = size
+    shape = (height, width) if grayscale else (height, width, 3)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    # 이전에 만든 저장소는 다 쓸 때까지 쓰지 못하게 메타데이터부터 지움
+    meta_path = sidecar_path(store_path)
+    if os.path.exists(meta_path):
+        os.unlink(meta_path)
+
+    # CAP_PROP_FRAME_COUNT 는 추정치이므로 실제 프레임 수는 메타데이터에 기록 (남는 뒷부분은 읽지 않음)
+    capacity = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or INITIAL_CAPACITY
+    temp_path = store_path + '.tmp'
+    frames = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8, shape=(capacity,) + shape)
+    count = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if count == capacity:
+                # 추정치보다 프레임이 많으면 두 배 크기 저장소로 옮김 (드묾)
+                frames.flush()
+                del frames
+                os.replace(temp_path, temp_path + '.old')
+                old = np.load(temp_path + '.old', mmap_mode='r')
+                capacity *= 2
+                frames = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8,
+                                                   shape=(capacity,) + shape)
+                frames[:count] = old
+                del old
+                os.unlink(temp_path + '.old')
+
+            if (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size)
+            if grayscale:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, frames[count])
+            else:
+                frames[count] = frame
+            count += 1
+        frames.flush()
+        del frames
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    finally:
+        cap.release()
+
+    if count == 0:
+        os.unlink(temp_path)
+        raise IOError(f"No frames could be read from {video_path!r}")
+    os.replace(temp_path, store_path)
+
+    stat = os.stat(video_path)
+    _write_json(meta_path, {
+        "version": STORE_VERSION,
+        "source": os.path.abspath(video_path),
+        "source_bytes": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "frames": count,
+        "width": width,
+        "height": height,
+        "grayscale": grayscale,
+        "fps": fps,
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+    })
+    return FrameStore(store_path)
+
+
+class FrameStore:
+    """build_frame_store 로 만든 프레임 저장소를 읽기 전용 메모리 매핑으로 여는 클래스
+
+    프레임은 매핑된 파일의 뷰 (복사 없음, 쓰기 불가) 이므로 같은 저장소를 여는 여러 실행/작업 프로세스가
+    디스크 캐시의 같은 페이지를 공유하고, 다시 디코딩하지 않는다.
+    lane_detection.iter_lane_results 와 lane_analyzer.compare_profiles 에 영상 대신 넘길 수 있다
+    (원본 영상이 바뀐 저장소는 두 함수 모두 FrameStoreError 로 거부).
+    """
+
+    def __init__(self, store_path):
+        meta_path = sidecar_path(store_path)
+        if not os.path.exists(meta_path):
+            raise FrameStoreError(f"Frame store {store_path!r} is missing or incomplete (no {meta_path!r})")
+        with open(meta_path) as f:
+            self.metadata = json.load(f)
+        if self.metadata.get("version") != STORE_VERSION:
+            raise FrameStoreError(f"Unsupported frame store version: {self.metadata.get('version')!r}")
+
+        self.path = store_path
+        self.frames = np.load(store_path, mmap_mode='r')[:self.metadata["frames"]]
+        self.size = (self.metadata["width"], self.metadata["height"])
+        self.grayscale = self.metadata["grayscale"]
+        self.fps = self.metadata["fps"]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def timestamp(self, index):
+        """index 번째 프레임의 시각 (초, fps 기준, fps 를 모르면 None)"""
+        return index / self.fps if self.fps > 0 else None
+
+    def is_stale(self):
+        """원본 영상이 저장소를 만든 뒤 바뀌었거나 없어졌는지 확인하는 함수"""
+        try:
+            stat = os.stat(self.metadata["source"])
+        except OSError:
+            return True
+        return (stat.st_size, stat.st_mtime_ns) != (self.metadata["source_bytes"],
+                                                    self.metadata["source_mtime_ns"])
+
+    def require_fresh(self):
+        """원본 영상이 저장소를 만든 뒤 바뀌었거나 없어졌으면 FrameStoreError 를 발생시키는 함수 (아니면 self)"""
+        if self.is_stale():
+            raise FrameStoreError(f"Frame store {self.path!r} is stale: {self.metadata['source']!r} changed or "
+                                  f"is missing since the store was built (rebuild it with frame_store.py)")
+        return self
+
+
+def is_frame_store(path):
+    """path 가 프레임 저장소 (.npy) 경로인지 확인하는 함수"""
+    return isinstance(path, (str, os.PathLike)) and os.fspath(path).endswith('.npy')
+
+
+def parse_size(text):
+    width, height = map(int, text.lower().split('x'))
+    return width, height
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="영상을 한 번 디코딩해서 메모리 매핑용 프레임 저장소 (.npy + .json) 로 저장")
+    parser.add_argument('video_path', help="디코딩할 영상")
+    parser.add_argument('store_path', help="저장소 경로 (<이름>.npy, 메타데이터는 <이름>.json)")
+    parser.add_argument('--size', type=parse_size, default=None, help="저장 해상도 WIDTHxHEIGHT (기본: 원본)")
+    parser.add_argument('--gray', action='store_true', help="흑백으로 저장")
+    args = parser.parse_args()
+
+    store = build_frame_store(args.video_path, args.store_path, args.size, args.gray)
+    print(f"{args.store_path}: {len(store)} 프레임, {store.size[0]}x{store.size[1]}"
+          f"{' 흑백' if store.grayscale else ''}, {os.path.getsize(args.store_path) / (1024*1024):.1f}MB")
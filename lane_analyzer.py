@@ -0,0 +1,660 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from stage_profiler import PROFILER
+
+# 전처리 파라미터
+BLUR_KSIZE = (7, 7)
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+CANNY_LOW = 30
+CANNY_HIGH = 150
+
+# 허프 변환 파라미터
+HOUGH_RHO = 1
+HOUGH_THETA = np.pi / 180
+HOUGH_THRESHOLD = 40
+HOUGH_MIN_LINE_LENGTH = 35
+HOUGH_MAX_LINE_GAP = 100
+
+# 캐시할 해상도별 계획의 최대 개수
+MAX_PLANS = 8
+
+# 차선 주변 탐색 영역(corridor)을 처리할 때 사각형 바깥으로 더 처리할 여유 픽셀
+CORRIDOR_PADDING = 16
+
+# 기울어진 탐색 영역을 몇 개의 가로 띠로 나눠서 처리할지 (띠마다 외접 사각형이 좁아짐)
+# 띠마다 OpenCV 호출 비용이 따로 들므로 띠 높이가 CORRIDOR_STRIP_ROWS 보다 낮아지지 않게 줄인다
+# (1/2 해상도 ROI 0.8 의 54행 영역은 띠 하나, 960x540 ROI 0.6 의 216행 영역은 띠 셋)
+CORRIDOR_STRIPS = 3
+CORRIDOR_STRIP_ROWS = 64
+
+# ROI 위쪽으로 함께 처리할 여유 행 수 (블러/모폴로지/캐니 커널이 ROI 안쪽 결과에 영향을 주는 범위)
+ROI_MARGIN = 32
+
+# 전처리 프로파일 (CLAHE 를 어디서 수행할지)
+# "quality": 원본 크기 버퍼에서 CLAHE (프레임 전체를 전처리한 것과 같은 결과)
+# "balanced": ROI 밴드에서만 CLAHE (타일 크기는 비슷하게 유지)
+# "fast": CLAHE 생략
+# 모폴로지 닫힘 연산은 모든 프로파일에서 morphologyEx(MORPH_CLOSE) 한 번으로 수행한다 (dilate + erode 와 동일)
+PROFILES = {
+    "quality": "frame",
+    "balanced": "band",
+    "fast": None,
+}
+DEFAULT_PROFILE = "quality"
+
+# 유효한 차선 쌍의 조건 (모든 엔진이 같은 기준을 사용)
+MIN_LANE_SLOPE = 0.5    # 두 차선 모두 |dx/dy| 가 이보다 커야 함
+MIN_LANE_WIDTH = 100    # 아래쪽 차선 간격 범위 (픽셀, 양 끝 제외)
+MAX_LANE_WIDTH = 500
+
+
+def roi_polygon(height, width, roi_ratio):
+    """ROI 사다리꼴 꼭짓점을 반환하는 함수 (ROI 마스크와 다른 엔진이 같은 모양을 사용)"""
+    bottom_padding = 0
+    roi_height = int(height * (1 - roi_ratio))
+
+    return np.array([
+        [(50, height-bottom_padding),
+         (width-50, height-bottom_padding),
+         (width-100, height-roi_height),
+         (100, height-roi_height)]
+    ])
+
+
+class _Workspace:
+    """한 번의 분석에 필요한 중간 버퍼 묶음 (스레드 하나가 독점해서 사용)"""
+
+    def __init__(self, plan):
+        frame = (plan.height, plan.width)
+        band = (plan.height - plan.band_top, plan.width)
+        self.clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+        self.band_clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=plan.band_tile_grid)
+        self.gray = np.empty((plan.height - plan.blur_top, plan.width), np.uint8)
+
+        # CLAHE 는 원본 크기 버퍼에서 수행한다 (밴드 위쪽 행은 결과에 영향이 없으므로 채우지 않음)
+        self.blur = np.zeros(frame, np.uint8)
+        self.enhanced = np.empty(frame, np.uint8)
+
+        self.closed = np.empty(band, np.uint8)
+        self.edges = np.empty(band, np.uint8)
+        self.masked = np.empty(band, np.uint8)
+
+        # 차선 주변 탐색 영역 처리용 (영역 크기가 매번 달라서 밴드 크기 버퍼의 일부를 뷰로 사용)
+        self.corridor_clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+        self.corridor_mask = np.empty(band, np.uint8)
+
+        # 허프 변환도 원본 크기 캔버스에서 수행한다 (밴드 위쪽은 항상 0)
+        self.canvas = np.zeros(frame, np.uint8)
+        self.processed = self.canvas[plan.band_top:]
+
+
+class FramePlan:
+    """(height, width, roi_ratio) 별로 한 번만 만드는 사전 계산 결과
+
+    흑백 변환, 블러, 모폴로지, 캐니는 ROI 사다리꼴을 포함하는 아래쪽 밴드에서만 수행한다.
+    CLAHE 는 타일 히스토그램과 행 좌표로 보간하므로 원본 크기 버퍼에서 그대로 수행하고,
+    밴드 시작 행은 ROI 위 여유 행까지 같은 타일 LUT 로 보간되도록 타일 경계에 맞춘다.
+    """
+
+    def __init__(self, height, width, roi_ratio):
+        self.height = height
+        self.width = width
+        self.roi_ratio = roi_ratio
+
+        # 모폴로지 커널
+        self.close_kernel = np.ones((5, 5), np.uint8)
+        self.line_kernel = np.ones((3, 15), np.uint8)
+
+        polygon = roi_polygon(height, width, roi_ratio)
+        roi_top = int(polygon[0, :, 1].min())
+
+        # CLAHE 타일 높이 (크기가 나누어떨어지지 않으면 OpenCV 가 아래쪽을 패딩)
+        grid_x, grid_y = CLAHE_TILE_GRID
+        if height % grid_y == 0 and width % grid_x == 0:
+            tile_h = height // grid_y
+        else:
+            tile_h = (height + grid_y - height % grid_y) // grid_y
+        self.tile_size = (-(-width // grid_x), tile_h)
+
+        # 밴드 시작 행 (이 위쪽의 블러 결과는 ROI 여유 행의 CLAHE 결과에 쓰이지 않음)
+        first_tile = max(0, int(np.floor((roi_top - ROI_MARGIN) / tile_h - 0.5)))
+        self.band_top = first_tile * tile_h
+        self.blur_top = max(0, self.band_top - BLUR_KSIZE[1] // 2)
+
+        # 밴드에서만 CLAHE 를 수행할 때의 타일 개수 (타일 크기를 원본과 비슷하게 유지)
+        self.band_tile_grid = (grid_x, max(1, round(grid_y * (height - self.band_top) / height)))
+
+        # ROI 마스크 (roi_polygon, 밴드 부분만 사용)
+        self.full_mask = np.zeros((height, width), np.uint8)
+        cv2.fillPoly(self.full_mask, polygon, 255)
+        self.roi_mask = self.full_mask[self.band_top:]
+
+        # 작업 버퍼 풀: 스레드마다 하나씩 꺼내 쓰고 반납한다
+        self._free = []
+
+    def acquire(self):
+        """작업 버퍼를 하나 꺼내는 함수 (없으면 새로 만든다)"""
+        try:
+            return self._free.pop()
+        except IndexError:
+            return _Workspace(self)
+
+    def release(self, workspace):
+        """사용이 끝난 작업 버퍼를 반납하는 함수"""
+        self._free.append(workspace)
+
+
+class LaneAnalyzer:
+    """해상도별 계획을 캐시해 두고 재사용하는 차선 검출 엔진
+
+    profile 은 PROFILES 중 하나로, 인스턴스마다 전처리 정확도와 속도를 고를 수 있다.
+    입력 프레임은 BGR 또는 흑백 (단일 채널) 이며, 흑백이면 색 변환을 건너뛴다.
+    """
+
+    def __init__(self, max_plans=MAX_PLANS, profile=DEFAULT_PROFILE):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown preprocessing profile: {profile!r} (expected one of {tuple(PROFILES)})")
+        self.profile = profile
+        self.clahe_mode = PROFILES[profile]
+        self.max_plans = max_plans
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, height, width, roi_ratio):
+        """해상도와 ROI 비율에 맞는 계획을 반환하는 함수 (없으면 생성)"""
+        key = (height, width, roi_ratio)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+
+        plan = FramePlan(height, width, roi_ratio)
+        with self._lock:
+            plan = self._plans.setdefault(key, plan)
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        return plan
+
+    def _edges(self, plan, ws, frame, timer, artifacts=None):
+        """흑백/블러/CLAHE/선 연결 모폴로지/Canny/ROI 마스크를 ROI 밴드 위주로 수행"""
+        if artifacts is None:
+            # 블러 커널 여유 행을 포함한 밴드만 흑백 변환 (행 슬라이스는 복사 없는 뷰, 흑백 입력은 그대로 사용)
+            gray = frame[plan.blur_top:]
+            if gray.ndim == 3:
+                gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY, dst=ws.gray)
+
+            # 1. 가우시안 블러 (밴드 부분만 기록)
+            cv2.GaussianBlur(gray, BLUR_KSIZE, 0, dst=ws.blur[plan.blur_top:])
+        else:
+            # 1. 다른 검출기와 공유하는 전체 프레임 블러에서 밴드만 가져옴 (밴드 행은 밴드만 블러한 결과와 같음)
+            blurred = artifacts.blurred(BLUR_KSIZE, (plan.width, plan.height))
+            np.copyto(ws.blur[plan.band_top:], blurred[plan.band_top:])
+        timer.mark("gray_blur")
+
+        # 2. CLAHE (프로파일에 따라 원본 크기 / 밴드 / 생략)
+        if self.clahe_mode == "frame":
+            ws.clahe.apply(ws.blur, dst=ws.enhanced)
+            enhanced = ws.enhanced[plan.band_top:]
+        elif self.clahe_mode == "band":
+            enhanced = ws.band_clahe.apply(ws.blur[plan.band_top:], dst=ws.enhanced[plan.band_top:])
+        else:
+            enhanced = ws.blur[plan.band_top:]
+        timer.mark("clahe")
+
+        # 3. 모폴로지 닫힘 연산으로 점선 연결
+        cv2.morphologyEx(enhanced, cv2.MORPH_CLOSE, plan.close_kernel, dst=ws.closed)
+        timer.mark("morphology")
+
+        # 4. 캐니 엣지
+        cv2.Canny(ws.closed, CANNY_LOW, CANNY_HIGH, edges=ws.edges)
+        timer.mark("canny")
+
+        # ROI 마스크 적용
+        cv2.bitwise_and(ws.edges, plan.roi_mask, dst=ws.masked)
+        timer.mark("roi_mask")
+
+        # 가로로 끊어진 선 연결 (결과는 원본 크기 캔버스의 밴드 영역에 기록)
+        cv2.morphologyEx(ws.masked, cv2.MORPH_CLOSE, plan.line_kernel, dst=ws.processed)
+        timer.mark("morphology")
+        return ws.canvas
+
+    def _corridor_edges(self, plan, ws, frame, polygons):
+        """이전 차선 주변 영역(polygons)에서만 전처리를 수행
+
+        영역마다 가로 띠 (최대 CORRIDOR_STRIPS 개, 띠 높이 CORRIDOR_STRIP_ROWS 이상) 로 나누고,
+        띠마다 영역의 외접 사각형만 처리한다.
+        """
+        ws.processed[:] = 0
+        for polygon in polygons:
+            # 사다리꼴 꼭짓점: 왼쪽 아래, 오른쪽 아래, 오른쪽 위, 왼쪽 위
+            (lx_b, y_b), (rx_b, _), (rx_t, y_t), (lx_t, _) = polygon.astype(np.float64)
+            top = max(plan.band_top, int(y_t))
+            bottom = min(plan.height, int(y_b))
+            if bottom - top < BLUR_KSIZE[1]:
+                continue
+
+            strips = min(CORRIDOR_STRIPS, max(1, (bottom - top) // CORRIDOR_STRIP_ROWS))
+            edges_y = np.linspace(top, bottom, strips + 1).round().astype(int)
+            for y0, y1 in zip(edges_y[:-1], edges_y[1:]):
+                # 띠 위/아래 경계에서의 좌우 x 범위
+                t = (np.array([y0, y1]) - y_t) / (y_b - y_t)
+                x0 = int(np.floor((lx_t + (lx_b - lx_t) * t).min()))
+                x1 = int(np.ceil((rx_t + (rx_b - rx_t) * t).max()))
+                self._corridor_rect(plan, ws, frame, polygon, x0, x1, y0, y1)
+        return ws.canvas
+
+    def _corridor_rect(self, plan, ws, frame, polygon, x0, x1, y0, y1):
+        """사각형 [x0, x1) x [y0, y1) 의 차선 후보를 캔버스에 기록 (커널 여유만큼 넓혀서 처리)"""
+        px0 = max(0, x0 - CORRIDOR_PADDING)
+        px1 = min(plan.width, x1 + CORRIDOR_PADDING)
+        py0 = max(plan.band_top, y0 - CORRIDOR_PADDING)
+        py1 = min(plan.height, y1 + CORRIDOR_PADDING)
+        if px1 - px0 < BLUR_KSIZE[0] or py1 - py0 < BLUR_KSIZE[1]:
+            return
+        rows, cols = py1 - py0, px1 - px0
+        band_y = py0 - plan.band_top
+
+        gray = frame[py0:py1, px0:px1]
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY, dst=ws.gray[:rows, :cols])
+        blur = cv2.GaussianBlur(gray, BLUR_KSIZE, 0, dst=ws.blur[:rows, :cols])
+
+        # CLAHE 타일 크기를 전체 프레임과 비슷하게 유지
+        if self.clahe_mode is not None:
+            tile_w, tile_h = plan.tile_size
+            ws.corridor_clahe.setTilesGridSize((max(1, round(cols / tile_w)), max(1, round(rows / tile_h))))
+            enhanced = ws.corridor_clahe.apply(blur, dst=ws.enhanced[:rows, :cols])
+        else:
+            enhanced = blur
+
+        closed = cv2.morphologyEx(enhanced, cv2.MORPH_CLOSE, plan.close_kernel, dst=ws.closed[:rows, :cols])
+        edges = cv2.Canny(closed, CANNY_LOW, CANNY_HIGH, edges=ws.edges[:rows, :cols])
+
+        # 탐색 영역과 ROI 사다리꼴이 겹치는 부분만 남김
+        mask = ws.corridor_mask[:rows, :cols]
+        mask[:] = 0
+        cv2.fillPoly(mask, [polygon], 255, offset=(-px0, -py0))
+        cv2.bitwise_and(mask, plan.roi_mask[band_y:band_y + rows, px0:px1], dst=mask)
+        masked = cv2.bitwise_and(edges, mask, dst=ws.masked[:rows, :cols])
+
+        processed = cv2.morphologyEx(masked, cv2.MORPH_CLOSE, plan.line_kernel, dst=ws.closed[:rows, :cols])
+
+        # 여유 부분을 뺀 안쪽만 캔버스에 합집합으로 기록 (띠/영역끼리 겹칠 수 있음)
+        inner = processed[y0 - py0:y1 - py0, max(0, x0) - px0:min(plan.width, x1) - px0]
+        target = ws.canvas[y0:y1, max(0, x0):min(plan.width, x1)]
+        if inner.size:
+            cv2.max(target, inner, dst=target)
+
+    def detect_lines(self, frame, roi_ratio, corridor=None, artifacts=None):
+        """프레임에서 HoughLinesP 선분을 검출하는 함수
+
+        corridor 에 이전 차선 주변 영역 (int32 다각형 리스트, corridor_polygons 참고) 을 주면
+        ROI 사다리꼴 전체 대신 그 영역에서만 검출한다.
+        artifacts 에 같은 프레임의 FrameArtifacts 를 주면 frame 크기의 흑백/블러 영상을 그 캐시에서 가져와
+        같은 프레임을 처리하는 다른 검출기 (SafetyGuideSystem 등) 와 공유한다 (결과는 같음).
+        """
+        timer = PROFILER.timer()
+        height, width = frame.shape[:2]
+        plan = self.plan(height, width, roi_ratio)
+        ws = plan.acquire()
+        try:
+            if corridor is None:
+                processed = self._edges(plan, ws, frame, timer, artifacts)
+            else:
+                source = frame if artifacts is None else artifacts.gray((width, height))
+                processed = self._corridor_edges(plan, ws, source, corridor)
+                timer.mark("corridor")
+            lines = cv2.HoughLinesP(
+                processed,
+                rho=HOUGH_RHO,
+                theta=HOUGH_THETA,
+                threshold=HOUGH_THRESHOLD,
+                minLineLength=HOUGH_MIN_LINE_LENGTH,
+                maxLineGap=HOUGH_MAX_LINE_GAP
+            )
+            timer.mark("hough")
+            return lines
+        finally:
+            plan.release(ws)
+            timer.done()
+
+    def warmup(self, sample, roi_ratio, sizes=()):
+        """샘플 이미지로 계획과 버퍼를 미리 만들어 두는 함수
+
+        sizes 에 (width, height) 를 주면 샘플을 해당 크기로 바꿔서 추가로 준비한다.
+        """
+        self.detect_lines(sample, roi_ratio)
+        for width, height in sizes:
+            if (height, width) != sample.shape[:2]:
+                self.detect_lines(cv2.resize(sample, (width, height)), roi_ratio)
+
+
+def corridor_polygons(outline, height, half_width_bottom, half_width_top):
+    """road_outline 의 두 차선 주변 탐색 영역 (차선마다 사다리꼴 하나) 을 반환하는 함수
+
+    각 차선을 프레임 아래 끝까지 연장하고, 아래쪽은 half_width_bottom, 위쪽(top_y)은
+    half_width_top 만큼 좌우로 넓힌 사다리꼴을 int32 꼭짓점 배열로 만든다.
+    """
+    bottom_y, top_y = outline["bottom_y"], outline["top_y"]
+    polygons = []
+    for side in ("r", "s"):
+        bottom_x = outline["bottom_x_" + side]
+        top_x = outline["top_x_" + side]
+        end_x = bottom_x + (bottom_x - top_x) / (bottom_y - top_y) * (height - bottom_y)
+        polygons.append(np.array([
+            (end_x - half_width_bottom, height),
+            (end_x + half_width_bottom, height),
+            (top_x + half_width_top, top_y),
+            (top_x - half_width_top, top_y),
+        ]).round().astype(np.int32))
+    return polygons
+
+
+def line_mask(lines, height, roi_ratio):
+    """ROI 안쪽이면서 기울기 조건을 만족하는 선분의 마스크를 반환하는 함수
+
+    height 는 스칼라이거나 선분마다의 프레임 높이 배열 (배치 처리용) 이다.
+    """
+    x1, y1, x2, y2 = lines[:, 0].T
+    top_y = height * roi_ratio
+    dx = x2 - x1
+    dy = y2 - y1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = dy / dx
+    return (y1 >= top_y) & (y2 >= top_y) & (dx != 0) & ((slope > 0.05) | (slope < -0.5))
+
+
+def filter_lines(lines, height, roi_ratio):
+    """ROI 위쪽 선분과 수평/수직에 가까운 선분을 한 번에 걸러내는 함수
+
+    HoughLinesP 결과 ((N, 1, 4) int32 배열)를 받아 남은 선분을 같은 모양으로 반환한다.
+    """
+    return lines[line_mask(lines, height, roi_ratio)]
+
+
+def _greedy_groups(x_avg, min_distance):
+    """탐욕적 병합과 같은 그룹 번호를 매기는 함수
+
+    아직 쓰이지 않은 첫 번째 선을 기준으로 x 중점 차이가 min_distance 미만인
+    쓰이지 않은 선들을 한 그룹으로 묶는다. x 중점으로 정렬해 두고 searchsorted 로
+    후보 구간을 찾으므로 그룹 수만큼만 반복한다.
+    """
+    count = len(x_avg)
+    order = np.argsort(x_avg, kind='stable')
+    sorted_x = x_avg[order]
+
+    used = np.zeros(count, bool)
+    group = np.empty(count, np.intp)
+    n_groups = 0
+    anchor = 0
+    while True:
+        # 기준선과 가까운 선들 (x 중점 정렬 구간 중 아직 쓰이지 않은 것)
+        lo = np.searchsorted(sorted_x, x_avg[anchor] - min_distance, side='right')
+        hi = np.searchsorted(sorted_x, x_avg[anchor] + min_distance, side='left')
+        members = order[lo:hi]
+        members = members[~used[members]]
+
+        used[anchor] = True
+        group[anchor] = n_groups
+        used[members] = True
+        group[members] = n_groups
+        n_groups += 1
+
+        if used.all():
+            return group, n_groups
+        anchor = int(used.argmin())
+
+
+def _group_means(segments, group, n_groups):
+    """그룹별 선분 평균을 int32 로 반환하는 함수 (그룹 순서대로 정렬한 뒤 reduceat 으로 합산)"""
+    by_group = np.argsort(group, kind='stable')
+    sizes = np.bincount(group, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    sums = np.add.reduceat(segments[by_group].astype(np.float64), starts, axis=0)
+    return (sums / sizes[:, None]).astype(np.int32)
+
+
+def merge_close_lines(lines, min_distance=50):
+    """가까운 선들을 하나로 합치는 함수 (기존 탐욕적 병합과 같은 결과)"""
+    if lines is None or len(lines) < 2:
+        return lines
+
+    segments = np.asarray(lines).reshape(-1, 4)
+    if len(segments) == 2:
+        # 추적기가 매 프레임 내는 두 차선: 정렬/그룹 연산 없이 바로 처리 (결과는 같음)
+        first, second = segments.astype(np.float64)
+        if abs((first[0] + first[2]) - (second[0] + second[2])) / 2 >= min_distance:
+            return segments.astype(np.int32).reshape(-1, 1, 4)
+        return ((first + second) / 2).astype(np.int32).reshape(1, 1, 4)
+
+    x_avg = (segments[:, 0] + segments[:, 2]) / 2
+    group, n_groups = _greedy_groups(x_avg, min_distance)
+    return _group_means(segments, group, n_groups).reshape(-1, 1, 4)
+
+
+def merge_close_lines_batch(segments, frame_ids, min_distance=50):
+    """여러 프레임의 선분을 프레임별로 병합하는 함수
+
+    segments 는 (N, 4), frame_ids 는 선분이 속한 프레임 번호 (오름차순) 이다.
+    프레임마다 x 중점에 큰 오프셋을 더해서 다른 프레임의 선과는 절대 묶이지 않게 한다.
+    병합된 선분 (M, 4) 과 각 선분의 프레임 번호를 반환한다.
+    """
+    if len(segments) == 0:
+        return segments, frame_ids
+
+    x_avg = (segments[:, 0] + segments[:, 2]) / 2
+    offset = np.ceil(x_avg.max() - x_avg.min()) + 2 * min_distance + 1
+    group, n_groups = _greedy_groups(x_avg + frame_ids * offset, min_distance)
+
+    merged = _group_means(segments, group, n_groups)
+    merged_ids = np.empty(n_groups, frame_ids.dtype)
+    merged_ids[group] = frame_ids
+    return merged, merged_ids
+
+
+def pick_lane_pairs(segments, frame_ids, n_frames):
+    """프레임마다 x 중점이 가장 오른쪽인 두 선을 고르는 함수
+
+    (두 선이 있는 프레임 마스크, 오른쪽 끝 선 (n_frames, 4), 그 다음 선 (n_frames, 4)) 를 반환한다.
+    """
+    right_most = np.zeros((n_frames, 4), np.int32)
+    second_right = np.zeros((n_frames, 4), np.int32)
+    counts = np.bincount(frame_ids, minlength=n_frames)
+    has_pair = counts >= 2
+    if not has_pair.any():
+        return has_pair, right_most, second_right
+
+    # 프레임 오름차순, 프레임 안에서는 x 중점 내림차순 (같으면 원래 순서)
+    x_avg = (segments[:, 0] + segments[:, 2]) / 2
+    order = np.lexsort((-x_avg, frame_ids))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    frames = np.flatnonzero(has_pair)
+    right_most[frames] = segments[order[starts[frames]]]
+    second_right[frames] = segments[order[starts[frames] + 1]]
+    return has_pair, right_most, second_right
+
+
+def lane_outlines(segments, segment_ids, heights, widths, roi_ratio):
+    """프레임별 HoughLinesP 선분으로부터 두 차선의 외곽선을 계산하는 함수
+
+    segments 는 모든 프레임의 선분 (N, 4), segment_ids 는 선분의 프레임 번호,
+    heights/widths 는 프레임별 크기 배열이다.
+    (유효한 외곽선이 있는 프레임 마스크, 외곽선 배열 dict) 를 반환한다.
+    dict 의 값은 프레임 수 길이의 배열이며 유효하지 않은 프레임의 값은 의미가 없다.
+    """
+    n_frames = len(heights)
+
+    # 기울기/ROI 필터링 후 프레임별로 가까운 선들 병합
+    keep = line_mask(segments[:, None], heights[segment_ids], roi_ratio)
+    merged, merged_ids = merge_close_lines_batch(segments[keep], segment_ids[keep])
+
+    # 프레임별 오른쪽 두 차선
+    has_pair, right_most, second_right = pick_lane_pairs(merged, merged_ids, n_frames)
+
+    x1_r, y1_r, x2_r, y2_r = right_most.T
+    x1_s, y1_s, x2_s, y2_s = second_right.T
+
+    # 차선 외삽
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope_r = (x2_r - x1_r) / (y2_r - y1_r)
+        slope_s = (x2_s - x1_s) / (y2_s - y1_s)
+
+        not_flat = (y2_r != y1_r) & (y2_s != y1_s)
+
+        bottom_y = heights - 30
+        top_y = heights * roi_ratio
+
+        bottom_x_r = x1_r + slope_r * (bottom_y - y1_r)
+        bottom_x_s = x1_s + slope_s * (bottom_y - y1_s)
+        top_x_r = x1_r + slope_r * (top_y - y1_r)
+        top_x_s = x1_s + slope_s * (top_y - y1_s)
+
+        outline = {
+            "bottom_x_r": bottom_x_r,
+            "bottom_x_s": bottom_x_s,
+            "bottom_y": bottom_y,
+            "top_x_r": top_x_r,
+            "top_x_s": top_x_s,
+            "top_y": top_y,
+            "slope_r": slope_r,
+            "slope_s": slope_s,
+        }
+        valid = has_pair & not_flat & outline_valid(outline)
+    return valid, outline
+
+
+def outline_valid(outline):
+    """차선 간격이 충분히 넓고 기울기가 충분한지 반환하는 함수 (값은 스칼라 또는 프레임별 배열)
+
+    lane_outlines 와 다른 엔진 (lane_scanline, lane_birdseye) 이 같은 기준으로 외곽선을 거른다.
+    """
+    steep_enough = (np.abs(outline["slope_r"]) > MIN_LANE_SLOPE) & (np.abs(outline["slope_s"]) > MIN_LANE_SLOPE)
+    lane_width = np.abs(outline["bottom_x_r"] - outline["bottom_x_s"])
+    return steep_enough & (lane_width > MIN_LANE_WIDTH) & (lane_width < MAX_LANE_WIDTH)
+
+
+def lane_outline(lines, height, width, roi_ratio):
+    """한 프레임의 HoughLinesP 결과로부터 road_outline dict 를 계산하는 함수 (유효하지 않으면 None)
+
+    lane_outlines 와 같은 계산을 배치 배열 없이 수행한다 (매 프레임 부르는 엔진에서도 가볍게).
+    """
+    if lines is None:
+        return None
+    pair = pick_lane_pair(merge_close_lines(filter_lines(lines, height, roi_ratio)))
+    if pair is None:
+        return None
+    (x1_r, y1_r, x2_r, y2_r), (x1_s, y1_s, x2_s, y2_s) = pair[0].tolist(), pair[1].tolist()
+    if y2_r == y1_r or y2_s == y1_s:
+        return None
+
+    # 차선 외삽
+    slope_r = (x2_r - x1_r) / (y2_r - y1_r)
+    slope_s = (x2_s - x1_s) / (y2_s - y1_s)
+    bottom_y = height - 30
+    top_y = height * roi_ratio
+    outline = {
+        "bottom_x_r": x1_r + slope_r * (bottom_y - y1_r),
+        "bottom_x_s": x1_s + slope_s * (bottom_y - y1_s),
+        "bottom_y": float(bottom_y),
+        "top_x_r": x1_r + slope_r * (top_y - y1_r),
+        "top_x_s": x1_s + slope_s * (top_y - y1_s),
+        "top_y": float(top_y),
+        "slope_r": slope_r,
+        "slope_s": slope_s,
+    }
+    if not outline_valid(outline):
+        return None
+    return outline
+
+
+def outline_centered(outline, widths):
+    """화면 중앙선이 두 차선 사이 (아래쪽 또는 위쪽) 를 지나는지 반환하는 함수"""
+    center_x = widths / 2
+    bottom_x_r, bottom_x_s = outline["bottom_x_r"], outline["bottom_x_s"]
+    top_x_r, top_x_s = outline["top_x_r"], outline["top_x_s"]
+    return (
+        ((np.minimum(bottom_x_r, bottom_x_s) <= center_x) & (center_x <= np.maximum(bottom_x_r, bottom_x_s))) |
+        ((np.minimum(top_x_r, top_x_s) <= center_x) & (center_x <= np.maximum(top_x_r, top_x_s)))
+    )
+
+
+def pick_lane_pair(lines):
+    """x 중점이 가장 오른쪽인 두 선 (오른쪽 끝 차선, 그 다음 차선)을 반환하는 함수"""
+    if lines is None or len(lines) < 2:
+        return None
+
+    segments = np.asarray(lines).reshape(-1, 4)
+    x_avg = (segments[:, 0] + segments[:, 2]) / 2
+    right_most, second_right = np.argsort(-x_avg, kind='stable')[:2]
+    return segments[right_most], segments[second_right]
+
+
+def compare_profiles(video_path, roi_ratio=0.6, reference=DEFAULT_PROFILE):
+    """동영상의 모든 프레임에서 프로파일별 검출 시간과 reference 프로파일과의 일치도를 비교하는 함수
+
+    프로파일마다 (프레임당 검출 시간 ms, 점수 일치 비율, 외곽선 x 좌표 차이 중앙값) 을 반환한다.
+    점수 일치는 외곽선 유무와 중앙 여부 (outline_centered) 가 모두 같은 경우이다.
+    video_path 가 프레임 저장소 (frame_store.py 로 만든 .npy) 이면 디코딩하지 않고 매핑된 프레임을 쓴다.
+    """
+    import time
+    from frame_store import FrameStore, is_frame_store
+
+    if is_frame_store(video_path):
+        frames = FrameStore(video_path).require_fresh()
+    else:
+        cap = cv2.VideoCapture(video_path)
+        frames = []
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    if not frames:
+        raise ValueError(f"No frames in {video_path}")
+
+    def run(profile):
+        analyzer = LaneAnalyzer(profile=profile)
+        analyzer.warmup(frames[0], roi_ratio)
+        outlines = []
+        elapsed = 0.0
+        for frame in frames:
+            start = time.perf_counter()
+            lines = analyzer.detect_lines(frame, roi_ratio)
+            elapsed += time.perf_counter() - start
+            outlines.append(lane_outline(lines, frame.shape[0], frame.shape[1], roi_ratio))
+        return outlines, elapsed / len(frames) * 1000
+
+    def score(outline, width):
+        return None if outline is None else bool(outline_centered(outline, width))
+
+    expected, _ = run(reference)
+    report = {}
+    for profile in PROFILES:
+        outlines, ms = run(profile)
+        agree = np.mean([score(a, f.shape[1]) == score(b, f.shape[1])
+                         for a, b, f in zip(expected, outlines, frames)])
+        diffs = [abs(a[key] - b[key]) for a, b in zip(expected, outlines) if a and b
+                 for key in ("bottom_x_r", "bottom_x_s", "top_x_r", "top_x_s")]
+        report[profile] = (ms, float(agree), float(np.median(diffs)) if diffs else None)
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 2:
+        print("Usage: python lane_analyzer.py <video_path | frame_store.npy>")
+        sys.exit(1)
+
+    for profile, (ms, agree, median_diff) in compare_profiles(sys.argv[1]).items():
+        median_diff = "-" if median_diff is None else f"{median_diff:.1f}px"
+        print(f"{profile:9s} {ms:6.2f} ms/frame  score agreement {agree:.1%}  median x diff {median_diff}")
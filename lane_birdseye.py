@@ -0,0 +1,223 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from lane_analyzer import MAX_PLANS, outline_valid, roi_polygon
+
+# 위에서 내려다본 (bird's-eye) 이진 영상 크기 (width, height)
+WARP_SIZE = (160, 240)
+
+# 카메라 소실점 (프레임 너비/높이 대비 비율)
+# ROI 아래 모서리에서 소실점을 향하는 두 직선 사이가 변환 후 직사각형이 된다
+VANISHING_POINT = (0.505, 0.555)
+
+# ROI 위쪽이 소실점 위로 올라가면 (예: roi_ratio 0.5) 사다리꼴 위쪽 행을 소실점보다 이만큼 아래로 내림
+# (프레임 높이 대비 비율, 외곽선의 top_y 는 그대로 ROI 위쪽 행)
+HORIZON_MARGIN = 0.02
+
+# 이진화 파라미터 (변환된 흑백 영상 기준)
+BACKGROUND_KSIZE = (21, 1)  # 주변 노면 밝기를 구할 가로 박스 필터 크기
+BINARY_THRESHOLD = 20       # 주변보다 이만큼 밝으면 차선 후보 픽셀
+
+# 히스토그램/슬라이딩 윈도우 파라미터 (변환 영상 픽셀 단위)
+HISTOGRAM_SMOOTH = 5        # 열 히스토그램 평활화 폭
+MIN_PEAK = 8                # 차선 시작점으로 인정할 최소 히스토그램 값
+N_WINDOWS = 9               # 세로 윈도우 개수
+WINDOW_MARGIN = 12          # 윈도우 반폭
+MIN_WINDOW_PIXELS = 5       # 윈도우 중심을 옮기는 데 필요한 최소 픽셀 수
+MIN_LANE_PIXELS = 30        # 차선으로 인정할 최소 픽셀 수
+
+# 두 차선 간격 (변환 영상 너비 대비 비율)
+MIN_LANE_SEPARATION = 0.25
+MAX_LANE_SEPARATION = 0.95
+
+
+class BirdsEyePlan:
+    """(height, width, roi_ratio) 별로 한 번만 만드는 원근 변환 행렬"""
+
+    def __init__(self, height, width, roi_ratio, vanishing_point=VANISHING_POINT):
+        self.height = height
+        self.width = width
+        self.roi_ratio = roi_ratio
+
+        # ROI 아래 모서리와 소실점을 잇는 두 직선을 ROI 위쪽 행 (소실점 근처면 그 아래) 에서 자른 사다리꼴
+        polygon = roi_polygon(height, width, roi_ratio)[0].astype(np.float64)
+        (left_x, bottom_y), (right_x, _) = polygon[0], polygon[1]
+        vp_x, vp_y = vanishing_point[0] * width, vanishing_point[1] * height
+        top_y = max(polygon[:, 1].min(), vp_y + HORIZON_MARGIN * height)
+        if top_y >= bottom_y:
+            raise ValueError("vanishing point must lie above the bottom of the ROI")
+        t = (bottom_y - top_y) / (bottom_y - vp_y)
+        source = np.float32([
+            (left_x, bottom_y),
+            (right_x, bottom_y),
+            (right_x + (vp_x - right_x) * t, top_y),
+            (left_x + (vp_x - left_x) * t, top_y),
+        ])
+
+        warp_w, warp_h = WARP_SIZE
+        target = np.float32([(0, warp_h), (warp_w, warp_h), (warp_w, 0), (0, 0)])
+        self.matrix = cv2.getPerspectiveTransform(source, target)
+        self.inverse = cv2.getPerspectiveTransform(target, source)
+
+
+class BirdsEyeAnalyzer:
+    """ROI 를 위에서 내려다본 이진 영상으로 바꾼 뒤 열 히스토그램과 슬라이딩 윈도우로 차선을 찾는 엔진
+
+    LaneAnalyzer (Canny + HoughLinesP + 병합) 대신 쓸 수 있으며 결과는 lane_outline 과 같은 dict 이다.
+    원근 변환 후에는 차선이 거의 세로선이 되므로 선분 병합 없이 픽셀 좌표만으로 직선을 맞춘다.
+    """
+
+    def __init__(self, vanishing_point=VANISHING_POINT, max_plans=MAX_PLANS):
+        self.vanishing_point = vanishing_point
+        self.max_plans = max_plans
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, height, width, roi_ratio):
+        """해상도와 ROI 비율에 맞는 변환 행렬을 반환하는 함수 (없으면 생성)"""
+        key = (height, width, roi_ratio)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                plan = BirdsEyePlan(height, width, roi_ratio, self.vanishing_point)
+                self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        return plan
+
+    def binary(self, frame, roi_ratio):
+        """프레임을 위에서 내려다본 차선 후보 이진 영상 (WARP_SIZE, bool) 으로 변환하는 함수"""
+        height, width = frame.shape[:2]
+        plan = self.plan(height, width, roi_ratio)
+
+        # 출력 크기만큼만 계산하므로 변환 후 흑백으로 바꾸는 편이 싸다
+        warped = cv2.warpPerspective(frame, plan.matrix, WARP_SIZE, flags=cv2.INTER_LINEAR)
+        if warped.ndim == 3:
+            warped = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
+
+        # 주변 노면보다 밝은 가는 세로 띠만 남김
+        background = cv2.blur(warped, BACKGROUND_KSIZE)
+        return cv2.subtract(warped, background) > BINARY_THRESHOLD
+
+    def detect_outline(self, frame, roi_ratio):
+        """프레임에서 두 차선을 찾아 road_outline dict 를 반환하는 함수 (찾지 못하면 None)"""
+        height, width = frame.shape[:2]
+        plan = self.plan(height, width, roi_ratio)
+        binary = self.binary(frame, roi_ratio)
+
+        bases = lane_bases(binary)
+        if bases is None:
+            return None
+        fits = sliding_window_fit(binary, bases)
+        if fits is None:
+            return None
+
+        # 변환 영상의 두 직선을 원래 좌표로 되돌림 (원근 변환은 직선을 직선으로 보낸다)
+        warp_h = WARP_SIZE[1]
+        ends = np.array([[a * y + b, y] for a, b in fits for y in (warp_h, 0)])
+        (x1_s, y1_s), (x2_s, y2_s), (x1_r, y1_r), (x2_r, y2_r) = unwarp_points(ends, plan.inverse)
+
+        # 차선 외삽
+        slope_r = (x2_r - x1_r) / (y2_r - y1_r)
+        slope_s = (x2_s - x1_s) / (y2_s - y1_s)
+        bottom_y = height - 30
+        top_y = height * roi_ratio
+        outline = {
+            "bottom_x_r": float(x1_r + slope_r * (bottom_y - y1_r)),
+            "bottom_x_s": float(x1_s + slope_s * (bottom_y - y1_s)),
+            "bottom_y": float(bottom_y),
+            "top_x_r": float(x1_r + slope_r * (top_y - y1_r)),
+            "top_x_s": float(x1_s + slope_s * (top_y - y1_s)),
+            "top_y": float(top_y),
+            "slope_r": float(slope_r),
+            "slope_s": float(slope_s),
+        }
+
+        # lane_analyzer.lane_outlines 와 같은 기준 (기울기, 차선 간격)
+        return outline if outline_valid(outline) else None
+
+    def warmup(self, sample, roi_ratio, sizes=()):
+        """샘플 이미지로 변환 행렬을 미리 만들어 두는 함수 (LaneAnalyzer.warmup 과 같은 인자)"""
+        self.detect_outline(sample, roi_ratio)
+        for width, height in sizes:
+            if (height, width) != sample.shape[:2]:
+                self.detect_outline(cv2.resize(sample, (width, height)), roi_ratio)
+
+
+def lane_bases(binary):
+    """아래쪽 절반의 열 히스토그램에서 두 차선의 시작 x 좌표 (왼쪽, 오른쪽) 를 반환하는 함수
+
+    가장 강한 봉우리와, 그로부터 차선 간격 범위만큼 떨어진 봉우리 중 가장 강한 것을 고른다.
+    """
+    warp_h, warp_w = binary.shape
+    histogram = np.count_nonzero(binary[warp_h // 2:], axis=0).astype(np.float64)
+    histogram = np.convolve(histogram, np.ones(HISTOGRAM_SMOOTH) / HISTOGRAM_SMOOTH, mode='same')
+
+    # 지역 최댓값
+    inner = histogram[1:-1]
+    peaks = np.flatnonzero((inner >= histogram[:-2]) & (inner > histogram[2:]) & (inner >= MIN_PEAK)) + 1
+    if len(peaks) < 2:
+        return None
+
+    first = peaks[np.argmax(histogram[peaks])]
+    separation = np.abs(peaks - first)
+    partners = peaks[(separation >= MIN_LANE_SEPARATION * warp_w) & (separation <= MAX_LANE_SEPARATION * warp_w)]
+    if not len(partners):
+        return None
+    second = partners[np.argmax(histogram[partners])]
+    return np.array(sorted((first, second)), dtype=np.float64)
+
+
+def sliding_window_fit(binary, bases):
+    """차선 시작점에서 위로 윈도우를 옮겨 가며 픽셀을 모아 차선마다 x = a*y + b 를 맞추는 함수
+
+    두 차선의 윈도우를 한 번에 처리한다. ((a, b) 두 개, 왼쪽부터) 를 반환하고
+    어느 한 차선이라도 픽셀이 부족하면 None 을 반환한다.
+    """
+    warp_h = binary.shape[0]
+    window_h = warp_h // N_WINDOWS
+    ys, xs = np.nonzero(binary)
+
+    # 아래쪽 윈도우부터 순서대로 픽셀을 나눠 둔다 (nonzero 는 행 순서이므로 뒤집기만 하면 된다)
+    ys, xs = ys[::-1], xs[::-1]
+    window = (warp_h - 1 - ys) // window_h
+    bounds = np.searchsorted(window, np.arange(N_WINDOWS + 1))
+
+    centers = bases.copy()
+    picked = np.zeros((len(xs), 2), bool)
+    for w in range(N_WINDOWS):
+        start, end = bounds[w], bounds[w + 1]
+        inside = np.abs(xs[start:end, None] - centers) < WINDOW_MARGIN
+        picked[start:end] = inside
+
+        # 픽셀이 충분한 차선만 윈도우 중심을 옮김 (점선의 빈 구간은 이전 중심 유지)
+        counts = inside.sum(axis=0)
+        moved = counts >= MIN_WINDOW_PIXELS
+        centers[moved] = (xs[start:end] @ inside)[moved] / counts[moved]
+
+    counts = picked.sum(axis=0)
+    if (counts < MIN_LANE_PIXELS).any():
+        return None
+
+    # 최소제곱 직선 (두 차선을 행렬 곱으로 한 번에)
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+    mean_y = ys @ picked / counts
+    mean_x = xs @ picked / counts
+    var_y = (ys * ys) @ picked / counts - mean_y * mean_y
+    cov_xy = (xs * ys) @ picked / counts - mean_x * mean_y
+    if (var_y <= 0).any():
+        return None
+    a = cov_xy / var_y
+    b = mean_x - a * mean_y
+    return list(zip(a, b))
+
+
+def unwarp_points(points, inverse):
+    """변환 영상의 점 (N, 2) 을 원래 프레임 좌표로 되돌리는 함수"""
+    homogeneous = np.hstack([points, np.ones((len(points), 1))]) @ inverse.T
+    return homogeneous[:, :2] / homogeneous[:, 2:]
@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+
+# ROI 위쪽으로 함께 지우고 합성할 여유 행 수 (선 두께, ROI 위쪽 끝에서 생성되는 코인 반지름)
+OVERLAY_MARGIN = 32
+
+# 점수 글자 (display_lines 의 putText 두 줄) 가 들어가는 위쪽 행 수
+TEXT_BOTTOM = 120
+
+# process_frame 의 합성 가중치 (원본 * FRAME_WEIGHT + 오버레이 + BLEND_GAMMA)
+FRAME_WEIGHT = 0.8
+BLEND_GAMMA = 1
+POLYGON_WEIGHT = 0.5
+
+
+class LaneCompositor:
+    """process_frame 의 차선 오버레이를 그리고 프레임에 합성하는 버퍼 묶음 (해상도/ROI 별로 한 번만 할당)
+
+    display_lines 가 그리는 것은 모두 위쪽 점수 글자 영역과 ROI 밴드 안에 있으므로,
+    매 프레임 그 행들만 지우고 섞는다. 나머지 행은 오버레이가 0 이므로 원본 밝기만 조정한다.
+    결과는 예전의 np.copy + 전체 크기 zeros_like 두 번 + addWeighted 두 번과 같다.
+    세션마다 하나씩 가지며 여러 스레드에서 동시에 쓰지 않는다.
+    """
+
+    def __init__(self, height, width, roi_ratio):
+        self.height = height
+        self.width = width
+        self.roi_ratio = roi_ratio
+
+        # 선/글자/코인을 그리는 캔버스와 차선 사이 다각형용 버퍼 (좌표를 그대로 쓰도록 원본 크기)
+        self.canvas = np.zeros((height, width, 3), np.uint8)
+        self.polygon = np.zeros((height, width, 3), np.uint8)
+
+        # 그림이 들어갈 수 있는 행 구간 (글자 영역, ROI 밴드) 과 그 밖의 행 구간
+        text_bottom = min(TEXT_BOTTOM, height)
+        band_top = max(0, int(height * roi_ratio) - OVERLAY_MARGIN)
+        if band_top <= text_bottom:
+            self.regions = [slice(0, height)]
+            self.plain = []
+        else:
+            self.regions = [slice(0, text_bottom), slice(band_top, height)]
+            self.plain = [slice(text_bottom, band_top)]
+        self.band = slice(band_top, height)
+
+    @property
+    def nbytes(self):
+        return self.canvas.nbytes + self.polygon.nbytes
+
+    def matches(self, height, width, roi_ratio):
+        return (self.height, self.width, self.roi_ratio) == (height, width, roi_ratio)
+
+    def begin(self):
+        """새 프레임을 그리기 전에 캔버스의 그림 영역만 지우고 캔버스를 반환하는 함수"""
+        for rows in self.regions:
+            self.canvas[rows] = 0
+        return self.canvas
+
+    def fill_polygon(self, polygon, color):
+        """차선 사이 다각형을 반투명하게 캔버스에 섞는 함수 (ROI 밴드 안에서만)"""
+        band = self.polygon[self.band]
+        band[:] = 0
+        cv2.fillPoly(self.polygon, [polygon], color)
+        canvas = self.canvas[self.band]
+        cv2.addWeighted(band, POLYGON_WEIGHT, canvas, 1, 0, canvas)
+
+    def composite(self, frame):
+        """캔버스를 frame 에 섞는 함수 (frame 을 직접 수정해서 반환)"""
+        for rows in self.plain:
+            cv2.convertScaleAbs(frame[rows], frame[rows], FRAME_WEIGHT, BLEND_GAMMA)
+        for rows in self.regions:
+            cv2.addWeighted(frame[rows], FRAME_WEIGHT, self.canvas[rows], 1, BLEND_GAMMA, frame[rows])
+        return frame
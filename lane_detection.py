@@ -1,317 +1,400 @@
+import os
+
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
+
+from frame_store import FrameStore, is_frame_store
+from lane_analyzer import LaneAnalyzer, filter_lines, lane_outline, merge_close_lines, outline_valid, pick_lane_pair
+from lane_compositor import LaneCompositor
+from lane_session import LaneSession
+from lane_tracker import LaneTracker
+from stage_profiler import NULL_TIMER, PROFILER
 
 # 전역 변수 설정
 ROI_HEIGHT_RATIO = 0.6  # 기본값 0.8 (80%)
 
-# 전역 변수 추가
-last_detected_lines = None
-last_detection_frame = 0
-DETECTION_INTERVAL = 20  # 20프레임마다 검출
+# 해상도별 계획을 재사용하는 차선 검출 엔진
+_analyzer = LaneAnalyzer()
+
+def new_session():
+    """영상 하나를 처리할 세션을 만드는 함수 (차선 추적기: 예측이 불확실하거나 변화가 클 때만 전체 검출)"""
+    return LaneSession(tracker=LaneTracker())
+
+# session 을 주지 않고 호출할 때 쓰는 세션 (main.py 처럼 영상 하나만 처리하는 경우)
+_session = new_session()
 
 def set_roi_height(ratio):
     """ROI 높이 비율을 설정하는 함수"""
     global ROI_HEIGHT_RATIO
     ROI_HEIGHT_RATIO = ratio
 
+def set_preprocess_profile(profile):
+    """차선 검출 전처리 프로파일을 설정하는 함수 (lane_analyzer.PROFILES 중 하나)"""
+    global _analyzer
+    _analyzer = LaneAnalyzer(profile=profile)
+
 def reset_detection_counter():
     """차선 검출 카운터를 초기화하는 함수"""
-    global last_detection_frame
-    last_detection_frame = 0
+    _session.reset_detection()
 
-def canny(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+def lane_area(lines, height):
+    """선분에서 display_lines 가 쓰는 병합된 선분과 두 차선 사이 영역을 구하는 함수
     
-    # 점선을 더 잘 감지하기 위한 전처리
-    # 1. 가우시안 블러 강화
-    blur = cv2.GaussianBlur(gray, (7, 7), 0)
+    (merged_lines, area) 를 반환한다. area 는 두 차선을 외삽한 좌표와 기울기 dict 이며,
+    두 차선을 찾지 못하면 None 이다.
+    """
+    if lines is None:
+        return None, None
     
-    # 2. 이미지 개선을 위한 CLAHE 적용
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    enhanced = clahe.apply(blur)
+    # 기울기/ROI 로 필터링한 뒤 가까운 선들 병합 (선분 배열 단위로 한 번에 처리)
+    filtered_lines = filter_lines(lines, height, ROI_HEIGHT_RATIO)
+    merged_lines = merge_close_lines(filtered_lines)
     
-    # 3. 모폴로지 연산으로 점선 연결
-    kernel = np.ones((5,5), np.uint8)
-    dilated = cv2.dilate(enhanced, kernel, iterations=1)
-    eroded = cv2.erode(dilated, kernel, iterations=1)
+    # 오른쪽에서 첫 번째와 두 번째 차선 (x 좌표 평균값이 가장 큰 두 선)
+    pair = pick_lane_pair(merged_lines)
+    if pair is None:
+        return merged_lines, None
+    x1_r, y1_r, x2_r, y2_r = pair[0]
+    x1_s, y1_s, x2_s, y2_s = pair[1]
+    if y2_r == y1_r or y2_s == y1_s:
+        return merged_lines, None
     
-    # 4. 캐니 엣지 파라미터 조정
-    canny = cv2.Canny(eroded, 30, 150)  # 낮은 임계값으로 조정
+    slope_r = (x2_r - x1_r) / (y2_r - y1_r)
+    slope_s = (x2_s - x1_s) / (y2_s - y1_s)
     
-    return canny
+    bottom_y = height - 30
+    top_y = height * ROI_HEIGHT_RATIO
+    return merged_lines, {
+        "bottom_x_r": x1_r + slope_r * (bottom_y - y1_r),
+        "bottom_x_s": x1_s + slope_s * (bottom_y - y1_s),
+        "bottom_y": bottom_y,
+        "top_x_r": x1_r + slope_r * (top_y - y1_r),
+        "top_x_s": x1_s + slope_s * (top_y - y1_s),
+        "top_y": top_y,
+        "slope_r": slope_r,
+        "slope_s": slope_s,
+    }
 
-class Coin:
-    def __init__(self, x, y, size=10):
-        self.x = x
-        self.y = y
-        self.size = size
-        self.speed = 5  # 코인이 아래로 내려오는 속도
+def score_area(area, width, session):
+    """차선 영역이 유효하면 세션 점수를 갱신하는 함수 ((유효 여부, 중앙 주행 여부) 반환)"""
+    if area is None:
+        return False, False
+    
+    # 차선 간격이 충분히 넓고 기울기가 충분할 때만 유효한 프레임 (검출기와 같은 기준)
+    if not outline_valid(area):
+        return False, False
+    session.valid_frames += 1
+    
+    # 중앙선이 초록색 영역을 통과하는지 확인
+    center_x = width / 2
+    centered = (min(area["bottom_x_r"], area["bottom_x_s"]) <= center_x <= max(area["bottom_x_r"], area["bottom_x_s"]) and
+                min(area["top_x_r"], area["top_x_s"]) <= center_x <= max(area["top_x_r"], area["top_x_s"]))
+    if centered:
+        session.center_frames += 1
+    
+    # 점수 계산 (백분율)
+    if session.valid_frames > 0:
+        session.total_score = int((session.center_frames / session.valid_frames) * 100)
+    return True, centered
 
-    def update(self, slope):
-        # 코인을 아래로 이동하면서 차선 기울기에 따라 x좌표도 조정
-        self.y += self.speed
-        self.x += self.speed * slope
-        # 크기도 점점 커지게 (원근감)
-        self.size = min(25, self.size + 0.5)
+def display_lines(image, lines, session=None, compositor=None):
+    """차선/점수/코인 오버레이 영상을 그리는 함수 (compositor 를 주면 그 캔버스에 그려서 반환)"""
+    return _render_lines(image, lines, session or _session, compositor)[0]
 
-def merge_close_lines(lines, min_distance=50):
-    """가까운 선들을 하나로 합치는 함수"""
-    if lines is None or len(lines) < 2:
-        return lines
-        
-    merged_lines = []
-    used = [False] * len(lines)
+def _update_display(lines, height, width, session):
+    """_render_lines 의 세션 상태 갱신 (프레임 수, 점수, 코인 생성/이동) 만 하는 함수
     
-    for i in range(len(lines)):
-        if used[i]:
-            continue
-            
-        current_line = lines[i][0]
-        x1, y1, x2, y2 = current_line
-        x_avg = (x1 + x2) / 2
-        
-        # 현재 선과 가까운 다른 선들을 찾아서 평균 계산
-        close_lines = [current_line]
-        used[i] = True
-        
-        for j in range(i + 1, len(lines)):
-            if used[j]:
-                continue
-                
-            other_line = lines[j][0]
-            ox1, oy1, ox2, oy2 = other_line
-            other_x_avg = (ox1 + ox2) / 2
-            
-            # x 좌표의 평균값 차이로 거리 계산
-            if abs(x_avg - other_x_avg) < min_distance:
-                close_lines.append(other_line)
-                used[j] = True
-        
-        if len(close_lines) >= 1:
-            # 가까운 선들의 평균 계산
-            avg_line = np.mean(close_lines, axis=0)
-            merged_lines.append(np.array([avg_line], dtype=np.int32))
+    ((병합된 선분, 차선 영역, 유효 여부, 중앙 주행 여부) 반환)
+    """
+    # 코인 리스트와 점수는 세션에 유지
+    session.display_frame_count += 1
+    
+    merged_lines, area = lane_area(lines, height)
+    valid, centered = score_area(area, width, session)
+    if not valid:
+        return merged_lines, area, valid, centered
     
-    return merged_lines if merged_lines else None
+    # 코인 생성 및 업데이트
+    if session.display_frame_count % 15 == 0:
+        session.coins.spawn((area["top_x_r"] + area["top_x_s"]) / 2, area["top_y"])
+    
+    # 차선의 평균 기울기로 모든 코인을 한 번에 이동하고, 화면 안에 있는 코인만 유지
+    avg_slope = (area["slope_r"] + area["slope_s"]) / 2
+    session.coins.step(avg_slope, height)
+    return merged_lines, area, valid, centered
 
-def display_lines(image, lines):
-    line_image = np.zeros_like(image)
+def _render_lines(image, lines, session, compositor):
+    """display_lines 본체 ((오버레이 영상, 차선 영역, 유효 여부, 중앙 주행 여부) 반환)"""
+    line_image = compositor.begin() if compositor is not None else np.zeros_like(image)
     height = image.shape[0]
     width = image.shape[1]
     
-    # 오인 리스트 (static variab                        le로 유지)
-    if not hasattr(display_lines, 'coins'):
-        display_lines.coins = []
-    if not hasattr(display_lines, 'frame_count'):
-        display_lines.frame_count = 0
+    merged_lines, area, valid, centered = _update_display(lines, height, width, session)
+    if merged_lines is not None:
+        for line in merged_lines:
+            x1, y1, x2, y2 = line[0]
+            cv2.line(line_image, (x1, y1), (x2, y2), (0, 0, 255), 3)
     
-    display_lines.frame_count += 1
+    # 두 차선이 모두 검출되고 유효한 경우 사이 영역을 초록색으로 채우기
+    if not valid:
+        return line_image, area, valid, centered
+    bottom_x_r, bottom_x_s, bottom_y = area["bottom_x_r"], area["bottom_x_s"], area["bottom_y"]
+    top_x_r, top_x_s, top_y = area["top_x_r"], area["top_x_s"], area["top_y"]
     
-    # 오른쪽에서 첫 번째와 두 번째 차선 찾기
-    right_most_line = None
-    second_right_line = None
-    right_lines = []
+    # 점수 표시
+    cv2.putText(line_image, f'Score: {session.total_score}%', 
+              (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 
+              1, (255, 255, 255), 2)
+    cv2.putText(line_image, f'Frames: {session.center_frames}/{session.valid_frames}', 
+              (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 
+              1, (255, 255, 255), 2)
     
-    if lines is not None:
-        # 기울기로 필터링된 선들
-        filtered_lines = []
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            if y1 < height * ROI_HEIGHT_RATIO or y2 < height * ROI_HEIGHT_RATIO:
-                continue
-                
-            if x2 != x1:
-                slope = (y2 - y1) / (x2 - x1)
-                if (slope > 0.05) or slope < -0.5:
-                    filtered_lines.append(line)
-        
-        # 가까운 선들 병합
-        if filtered_lines:
-            merged_lines = merge_close_lines(filtered_lines)
-            if merged_lines is not None:
-                for line in merged_lines:
-                    x1, y1, x2, y2 = line[0]
-                    x_avg = (x1 + x2) / 2
-                    right_lines.append((line[0], x_avg))
-                    cv2.line(line_image, (x1, y1), (x2, y2), (0, 0, 255), 3)
-        
-        # x 좌표 평균값을 기준으로 정렬
-        if right_lines:
-            right_lines.sort(key=lambda x: x[1], reverse=True)
-            if len(right_lines) >= 1:
-                right_most_line = right_lines[0][0]
-            if len(right_lines) >= 2:
-                second_right_line = right_lines[1][0]
-    
-    # 점수 변수 추가
-    if not hasattr(display_lines, 'total_score'):
-        display_lines.total_score = 0
-    if not hasattr(display_lines, 'valid_frames'):
-        display_lines.valid_frames = 0
-    if not hasattr(display_lines, 'center_frames'):
-        display_lines.center_frames = 0
-    
-    # 두 차선이 모두 검출된 경우 사이 영역을 초록색으로 채우기
-    if right_most_line is not None and second_right_line is not None:
-        x1_r, y1_r, x2_r, y2_r = right_most_line
-        x1_s, y1_s, x2_s, y2_s = second_right_line
+    # 코인 그리기 (노란색 원 + 광택 효과)
+    session.coins.draw(line_image)
+    
+    # polygon 그리기
+    polygon = np.array([
+        [int(bottom_x_r), int(bottom_y)],
+        [int(top_x_r), int(top_y)],
+        [int(top_x_s), int(top_y)],
+        [int(bottom_x_s), int(bottom_y)]
+    ], np.int32)
+    
+    if compositor is not None:
+        compositor.fill_polygon(polygon, (0, 255, 0))
+    else:
+        overlay = np.zeros_like(image)
+        cv2.fillPoly(overlay, [polygon], (0, 255, 0))
+        cv2.addWeighted(overlay, 0.5, line_image, 1, 0, line_image)
+    
+    # 중앙선 표시 (디버깅용)
+    center_x = width / 2
+    cv2.line(line_image, 
+            (int(center_x), height), 
+            (int(center_x), int(height * ROI_HEIGHT_RATIO)), 
+            (255, 0, 0), 2)
+    
+    return line_image, area, valid, centered
+
+def track_lanes(session, height, width, read_frame, timer=NULL_TIMER, artifacts=None, steps=1):
+    """추적기로 이번 프레임의 차선을 구하는 함수 ((차선 선분, 검출 여부) 반환)
+    
+    칼만 추적기로 차선 위치를 예측하고, 예측이 불확실하거나 변화가 클 때만 read_frame() 으로
+    프레임을 받아 새로 검출한다 (검출하지 않는 프레임은 디코딩하지 않아도 된다).
+    추적이 안정되면 예측된 차선 주변에서만 검출하고, 거기서 찾지 못하면 다음 검출은 ROI 전체에서 한다.
+    artifacts (FrameArtifacts) 를 주면 검출할 때 흑백/블러 결과를 다른 검출기와 공유한다.
+    steps 는 직전에 처리한 프레임부터 이번 프레임까지의 원본 프레임 수이다 (프레임을 건너뛰며 처리할 때).
+    """
+    if session.tracker is None:
+        session.tracker = LaneTracker()
+    tracker = session.tracker
+    
+    tracker.predict(steps)
+    detected = tracker.needs_detection()
+    if detected:
+        corridor = tracker.corridor(height, width)
+        frame = read_frame()
+        timer.mark("track")
+        lines = _analyzer.detect_lines(frame, ROI_HEIGHT_RATIO, corridor, artifacts)
+        outline = lane_outline(lines, height, width, ROI_HEIGHT_RATIO)
+        timer.skip()  # 검출 단계별 시간은 LaneAnalyzer 가 기록
         
-        if y2_r != y1_r and y2_s != y1_s:
-            slope_r = (x2_r - x1_r) / (y2_r - y1_r)
-            slope_s = (x2_s - x1_s) / (y2_s - y1_s)
-            
-            steep_enough = abs(slope_r) > 0.5 and abs(slope_s) > 0.5
-            
-            bottom_y = height - 30
-            top_y = height * ROI_HEIGHT_RATIO
-            
-            bottom_x_r = x1_r + slope_r * (bottom_y - y1_r)
-            bottom_x_s = x1_s + slope_s * (bottom_y - y1_s)
-            top_x_r = x1_r + slope_r * (top_y - y1_r)
-            top_x_s = x1_s + slope_s * (top_y - y1_s)
-            
-            # 차선 간격 계산
-            lane_width = abs(bottom_x_r - bottom_x_s)
-            
-            # 중앙선 좌표 계산
-            center_x = width / 2
-            
-            # 차선 간격이 충분히 넓고 기울기가 충분할 때
-            if lane_width > 100 and steep_enough and lane_width < 500:
-                # 유효한 프레임 카운트 증가
-                display_lines.valid_frames += 1
-                
-                # 중앙선이 초록색 영역을 통과하는지 확인
-                if min(bottom_x_r, bottom_x_s) <= center_x <= max(bottom_x_r, bottom_x_s):
-                    if min(top_x_r, top_x_s) <= center_x <= max(top_x_r, top_x_s):
-                        display_lines.center_frames += 1
-                
-                # 점수 계산 (백분율)
-                if display_lines.valid_frames > 0:
-                    display_lines.total_score = int((display_lines.center_frames / display_lines.valid_frames) * 100)
-                
-                # 점수 표시
-                cv2.putText(line_image, f'Score: {display_lines.total_score}%', 
-                          (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 
-                          1, (255, 255, 255), 2)
-                cv2.putText(line_image, f'Frames: {display_lines.center_frames}/{display_lines.valid_frames}', 
-                          (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 
-                          1, (255, 255, 255), 2)
+        if lines is not None:
+            session.last_detected_lines = lines
+        tracker.update(outline)
+        timer.mark("postprocess")
+    
+    # 추적 중인 차선 사용 (추적 전에는 이전에 검출된 선분)
+    tracked_lines = tracker.as_lines()
+    if tracked_lines is None:
+        tracked_lines = session.last_detected_lines
+    timer.mark("track")
+    return tracked_lines, detected
 
-                # 코인 생성 및 업데이트
-                if display_lines.frame_count % 15 == 0:
-                    coin_x = (top_x_r + top_x_s) / 2
-                    coin_y = top_y
-                    display_lines.coins.append(Coin(coin_x, coin_y))
-            
-                # 코인 업데이트 및 그리기
-                new_coins = []
-                for coin in display_lines.coins:
-                    # 차선의 평균 기울기로 코인 이동
-                    avg_slope = (slope_r + slope_s) / 2
-                    coin.update(avg_slope)
-                    
-                    # 화면 안에 있는 코인만 유지
-                    if coin.y < height:
-                        # 코인 그리기 (노란색 원)
-                        cv2.circle(line_image, 
-                                (int(coin.x), int(coin.y)), 
-                                int(coin.size), 
-                                (0, 255, 255), 
-                                -1)
-                        # 광택 효과
-                        highlight_size = max(2, int(coin.size // 3))
-                        cv2.circle(line_image, 
-                                (int(coin.x - coin.size//3), int(coin.y - coin.size//3)),
-                                highlight_size, 
-                                (255, 255, 255), 
-                                -1)
-                        new_coins.append(coin)
-                
-                # polygon 그리기
-                polygon = np.array([
-                    [int(bottom_x_r), int(bottom_y)],
-                    [int(top_x_r), int(top_y)],
-                    [int(top_x_s), int(top_y)],
-                    [int(bottom_x_s), int(bottom_y)]
-                ], np.int32)
-                
-                overlay = np.zeros_like(image)
-                cv2.fillPoly(overlay, [polygon], (0, 255, 0))
-                cv2.addWeighted(overlay, 0.5, line_image, 1, 0, line_image)
-                
-                # 중앙선 표시 (디버깅용)
-                cv2.line(line_image, 
-                        (int(center_x), height), 
-                        (int(center_x), int(height * ROI_HEIGHT_RATIO)), 
-                        (255, 0, 0), 2)
-                
-                display_lines.coins = new_coins
-    
-    return line_image
+def process_frame(frame, session=None, artifacts=None):
+    """프레임에 차선 오버레이를 합성해서 반환하는 함수 (복사하지 않고 frame 을 직접 수정)
 
-def region_of_interest(image):
-    height = image.shape[0]
-    width = image.shape[1]
+    artifacts: 같은 프레임을 처리하는 다른 검출기 (SafetyGuideSystem 등) 와 공유할 FrameArtifacts
+    (합성하기 전에 artifacts.detach() 로 원본을 복사해 두므로 이후 검출기는 오버레이 전 프레임을 본다)
+    """
+    return render_frame(frame, session, artifacts)[0]
+
+def render_frame(frame, session=None, artifacts=None, steps=1):
+    """process_frame 과 같지만 (합성된 프레임, score_frame 과 같은 결과 dict) 를 반환하는 함수 (steps 는 track_lanes 참고)"""
+    session = session or _session
+    timer = PROFILER.timer()
+    
+    height = frame.shape[0]
+    width = frame.shape[1]
+    
+    # 오버레이 버퍼는 해상도/ROI 가 바뀔 때만 새로 할당
+    compositor = session.compositor
+    if compositor is None or not compositor.matches(height, width, ROI_HEIGHT_RATIO):
+        compositor = session.compositor = LaneCompositor(height, width, ROI_HEIGHT_RATIO)
+    timer.mark("setup")
     
-    bottom_padding = 0
-    roi_height = int(height * (1 - ROI_HEIGHT_RATIO))  # ROI_HEIGHT_RATIO에 맞춰 조정
-    
-    polygons = np.array([
-        [(50, height-bottom_padding), 
-         (width-50, height-bottom_padding), 
-         (width-100, height-roi_height), 
-         (100, height-roi_height)]
-    ])
-    mask = np.zeros_like(image)
-    cv2.fillPoly(mask, polygons, 255)
-    masked_image = cv2.bitwise_and(image, mask)
-    return masked_image
+    tracked_lines, detected = track_lanes(session, height, width, lambda: frame, timer, artifacts, steps)
+    if artifacts is not None and artifacts.frame is frame:
+        artifacts.detach()
+    _, area, valid, centered = _render_lines(frame, tracked_lines, session, compositor)
+    timer.mark("display")
+    combo_image = compositor.composite(frame)
+    timer.mark("blend")
+    timer.done()
+    
+    return combo_image, frame_result(detected, area, valid, centered)
+
+# 결과 파일에 기록할 road_outline 좌표
+OUTLINE_KEYS = ("bottom_x_r", "bottom_x_s", "bottom_y", "top_x_r", "top_x_s", "top_y")
 
-def process_frame(frame):
-    global last_detected_lines, last_detection_frame
+def score_frame(read_frame, height, width, session=None, steps=1):
+    """오버레이를 그리지 않고 점수만 계산하는 함수 (headless 모드)
     
-    lane_image = np.copy(frame)
+    process_frame 과 같은 추적/점수 계산을 하지만, 검출할 때만 read_frame() 으로 (height, width) 프레임을 받는다.
+    {"detected", "score", "road_outline"} dict 를 반환한다. score 는 유효한 차선 영역이면
+    100.0 (중앙 주행) 또는 0.0, 아니면 None 이고 road_outline 은 점수를 매긴 차선 영역이다.
+    steps 는 track_lanes 참고.
+    """
+    session = session or _session
+    timer = PROFILER.timer()
     
-    # 30프레임마다 새로운 차선 검출
-    if last_detection_frame % DETECTION_INTERVAL == 0:
-        canny_image = canny(lane_image)
-        cropped_image = region_of_interest(canny_image)
+    tracked_lines, detected = track_lanes(session, height, width, read_frame, timer, steps=steps)
+    _, area = lane_area(tracked_lines, height)
+    valid, centered = score_area(area, width, session)
+    timer.mark("score")
+    timer.done()
+    
+    return frame_result(detected, area, valid, centered)
+
+def advance_frame(read_frame, height, width, session=None):
+    """오버레이를 그리지 않고 process_frame 과 같은 세션 상태 (추적기, 점수, 코인) 만 진행하는 함수
+    
+    결과를 버릴 프레임 (예: main.process_chunk 의 앞쪽 겹침 구간) 에서 다음 프레임의 오버레이가
+    순차 처리와 같아지도록 쓴다. 검출할 때만 read_frame() 으로 (height, width) 프레임을 받고,
+    score_frame 과 같은 결과 dict 를 반환한다.
+    """
+    session = session or _session
+    tracked_lines, detected = track_lanes(session, height, width, read_frame)
+    _, area, valid, centered = _update_display(tracked_lines, height, width, session)
+    return frame_result(detected, area, valid, centered)
+
+def frame_result(detected, area, valid, centered):
+    """score_frame / render_frame 의 프레임별 결과 dict 를 만드는 함수"""
+    return {
+        "detected": detected,
+        "score": (100.0 if centered else 0.0) if valid else None,
+        "road_outline": {key: float(area[key]) for key in OUTLINE_KEYS} if valid else None,
+    }
+
+def iter_lane_results(source, size=None, stride=1, start=0, max_frames=None, annotate=False, session=None):
+    """영상에서 프레임별 차선 결과를 (frame_index, timestamp, result) 로 하나씩 만들어 내는 제너레이터
+    
+    source 는 영상 경로, 카메라 번호, cv2.VideoCapture, 프레임 저장소 (FrameStore 또는 .npy 경로),
+    또는 프레임 (BGR/흑백 배열) iterable 이다. 프레임 저장소는 디코딩 없이 메모리 매핑된 프레임을 그대로 쓰고
+    start 프레임으로 바로 이동한다 (원본 영상이 바뀐 저장소는 FrameStoreError).
+    한 번에 프레임 하나만 메모리에 두며, 결과는 score_frame 과 같은 dict 이다.
+    size (width, height) 를 주면 그 크기로 바꿔서 분석한다 (좌표도 그 크기 기준).
+    start 이전 프레임과, 그 이후 stride 간격이 아닌 프레임은 건너뛴다 (결과도 내지 않음).
+    추적기는 건너뛴 프레임만큼 예측을 진행하므로 검출 간격과 격자는 원본 프레임 번호 기준이다
+    (새 추적기면 격자를 첫 프레임 번호에 맞춤).
+    max_frames 는 결과를 낼 최대 프레임 수이다.
+    annotate=True 이면 오버레이를 합성한 프레임을 result["frame"] 으로 함께 준다.
+    아니면 오버레이를 그리지 않고, 영상 입력에서는 검출하는 프레임만 디코딩을 마친다 (grab/retrieve).
+    timestamp 는 영상 입력이면 CAP_PROP_POS_MSEC 기준 초, 프레임 저장소면 fps 기준 초, 프레임 iterable 이면 None 이다.
+    session 을 주지 않으면 새 세션을 만든다 (추적기/점수가 다른 호출과 섞이지 않음).
+    """
+    if stride < 1:
+        raise ValueError(f"stride must be at least 1, got {stride}")
+    session = session or new_session()
+    size = tuple(size) if size is not None else None
+    
+    capture = None
+    store = None
+    owned = False
+    first = 0
+    if is_frame_store(source):
+        source = FrameStore(os.fspath(source))
+    if isinstance(source, FrameStore):
+        store = source.require_fresh()
+    elif isinstance(source, cv2.VideoCapture):
+        capture = source
+    elif isinstance(source, (str, os.PathLike, int)):
+        capture = cv2.VideoCapture(source if isinstance(source, int) else os.fspath(source))
+        owned = True
+        if not capture.isOpened():
+            raise IOError(f"Cannot open video source: {source!r}")
+    
+    def prepare(frame, copy):
+        if size is not None and (frame.shape[1], frame.shape[0]) != size:
+            frame, copy = cv2.resize(frame, size), False
+        if annotate and frame.ndim == 2:
+            # 오버레이는 BGR 캔버스에 합성하므로 흑백 프레임 (흑백 저장소 등) 은 BGR 로 바꿈 (분석 결과는 같음)
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        # 호출한 쪽의 프레임에 오버레이를 그리지 않도록 복사 (영상 입력은 매번 새 버퍼)
+        return frame.copy() if copy else frame
+    
+    try:
+        if capture is not None:
+            frames = _capture_frames(capture, prepare)
+            width, height = size or (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                     int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        elif store is not None:
+            # 매핑된 프레임을 그대로 분석 (annotate 이거나 크기를 바꿀 때만 새 버퍼)
+            first = min(start, len(store))
+            frames = ((lambda frame=store[index]: prepare(frame, annotate), store.timestamp(index))
+                      for index in range(first, len(store)))
+        else:
+            frames = ((lambda frame=frame: prepare(frame, annotate), None) for frame in source)
         
-        kernel = np.ones((3,15), np.uint8)
-        processed = cv2.dilate(cropped_image, kernel, iterations=1)
-        processed = cv2.erode(processed, kernel, iterations=1)
+        produced = 0
+        for index, (read_frame, timestamp) in enumerate(frames, first):
+            if max_frames is not None and produced >= max_frames:
+                break
+            if index < start or (index - start) % stride:
+                continue
+            
+            steps = stride if produced else 1
+            if not produced and session.tracker is not None and not session.tracker.frames:
+                session.tracker.seek(index)
+            if annotate:
+                frame, result = render_frame(read_frame(), session, steps=steps)
+                result["frame"] = frame
+            else:
+                if capture is None:
+                    frame = read_frame()
+                    read_frame = lambda frame=frame: frame
+                    height, width = frame.shape[:2]
+                result = score_frame(read_frame, height, width, session, steps)
+            produced += 1
+            yield index, timestamp, result
+    finally:
+        if owned:
+            capture.release()
+
+def _capture_frames(capture, prepare):
+    """VideoCapture 의 프레임마다 (read_frame, timestamp) 를 만드는 제너레이터
+    
+    프레임은 grab() 으로만 넘기고, read_frame() 을 호출한 프레임만 retrieve() 해서 prepare 를 거친다.
+    """
+    while capture.grab():
+        timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
         
-        lines = cv2.HoughLinesP(
-            processed,
-            rho=1,
-            theta=np.pi/180,
-            threshold=40,
-            minLineLength=35,
-            maxLineGap=100
-        )
+        def read_frame():
+            ret, frame = capture.retrieve()
+            if not ret:
+                raise IOError("Failed to retrieve a grabbed frame")
+            return prepare(frame, False)
         
-        if lines is not None:
-            last_detected_lines = lines
-    
-    # 이전에 검출된 차선 사용
-    line_image = display_lines(lane_image, last_detected_lines)
-    combo_image = cv2.addWeighted(lane_image, 0.8, line_image, 1, 1)
-    
-    last_detection_frame += 1
-    return combo_image
+        yield read_frame, timestamp
 
 # main.py에서 프레임 카운트 초기화를 위한 함수 추가
 def reset_detection_counter():
-    global last_detection_frame
-    last_detection_frame = 0 
+    _session.reset_detection()
+
+def detection_rate():
+    """전체 프레임 중 전체 검출을 수행한 비율을 반환하는 함수"""
+    return _session.tracker.detection_rate()
 
 # 점수 초기화 함수 수정
 def reset_score():
-    if hasattr(display_lines, 'total_score'):
-        display_lines.total_score = 0
-    if hasattr(display_lines, 'valid_frames'):
-        display_lines.valid_frames = 0
-    if hasattr(display_lines, 'center_frames'):
-        display_lines.center_frames = 0 
\ No newline at end of file
+    _session.reset_score() 
\ No newline at end of file
@@ -0,0 +1,158 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from lane_analyzer import MAX_PLANS, lane_outline, roi_polygon
+
+# 검사할 가로 스캔라인 개수 (ROI 위쪽 행부터 프레임 아래 끝까지 균등 간격)
+N_SCANLINES = 32
+
+# 1차원 에지 검출 파라미터 (흑백 밝기 기준)
+SMOOTH_WIDTH = 5            # 스캔라인 평활화 폭 (픽셀)
+GRADIENT_THRESHOLD = 24     # 양옆 픽셀 간 밝기 차이가 이보다 크면 에지 후보
+MAX_MARKING_WIDTH = 0.04    # 상승 에지와 하강 에지 사이 최대 간격 (프레임 너비 대비, 차선 도색 폭)
+
+# 직선 맞춤 파라미터
+MIN_POINTS = 4              # 차선마다 필요한 최소 스캔라인 수
+OUTLIER_DISTANCE = 0.02     # 맞춘 직선에서 이보다 먼 점이 있으면 가장 먼 점부터 버리고 다시 맞춤 (프레임 너비 대비)
+MAX_OUTLIERS = 8            # 버릴 수 있는 최대 점 개수
+
+
+@lru_cache(maxsize=MAX_PLANS)
+def scanline_plan(height, width, roi_ratio):
+    """(height, width, roi_ratio) 별 스캔라인 행 번호와 행마다 ROI 사다리꼴의 좌우 x 범위"""
+    polygon = roi_polygon(height, width, roi_ratio)[0].astype(np.float64)
+    (left_b, bottom_y), (right_b, _), (right_t, top_y), (left_t, _) = polygon
+    rows = np.linspace(top_y, height - 1, N_SCANLINES).round().astype(np.intp)
+    t = (rows - top_y) / (bottom_y - top_y)
+    left = left_t + (left_b - left_t) * t
+    right = right_t + (right_b - right_t) * t
+    return rows, left, right
+
+
+class ScanlineAnalyzer:
+    """ROI 안의 고정된 가로 스캔라인에서만 차선 도색을 찾는 초저지연 엔진
+
+    스캔라인마다 밝기 기울기의 상승/하강 봉우리 쌍을 차선 도색으로 보고,
+    위아래 스캔라인의 도색 위치를 이어서 만든 후보마다 최소제곱 직선을 맞춘다.
+    맞춘 직선을 선분으로 바꿔 lane_outline 에 넘기므로 차선 쌍 선택 (오른쪽 두 선) 과
+    유효성 기준은 허프 엔진과 같고, 과부하 시 LaneAnalyzer 대신 쓰는 것을 전제로 한다.
+    """
+
+    def detect_outline(self, frame, roi_ratio):
+        """프레임에서 두 차선을 찾아 road_outline dict 를 반환하는 함수 (찾지 못하면 None)"""
+        height, width = frame.shape[:2]
+        rows, left, right = scanline_plan(height, width, roi_ratio)
+
+        # 스캔라인만 모아서 (N_SCANLINES, width) 흑백 영상으로 처리
+        lines = frame[rows]
+        if lines.ndim == 3:
+            lines = cv2.cvtColor(lines, cv2.COLOR_BGR2GRAY)
+
+        # 가로 방향으로만 평활화한 뒤 양옆 픽셀 간 밝기 차이 (세로 방향으로는 섞지 않음)
+        smooth = cv2.blur(lines, (SMOOTH_WIDTH, 1))
+        gradient = cv2.Sobel(smooth, cv2.CV_16S, 1, 0, ksize=1)
+
+        row, x, keep = marking_centers(gradient, MAX_MARKING_WIDTH * width)
+        keep &= (x > left[row]) & (x < right[row])
+        row, x = row[keep], x[keep]
+
+        # 위아래로 이어진 도색마다 직선을 맞추고 후보 구간의 양 끝을 선분으로 사용
+        segments = []
+        top_limit = np.ceil(height * roi_ratio)
+        for track_y, track_x in marking_tracks(rows[row].astype(np.float64), x, MAX_MARKING_WIDTH * width):
+            fit = fit_line(track_y, track_x, OUTLIER_DISTANCE * width)
+            if fit is None:
+                continue
+            slope, intercept = fit
+            y_bottom, y_top = track_y.max(), max(track_y.min(), top_limit)
+            segments.append((slope * y_bottom + intercept, y_bottom, slope * y_top + intercept, y_top))
+        if len(segments) < 2:
+            return None
+
+        # 허프 엔진과 같은 기준으로 오른쪽 두 차선을 고르고 외삽/검사
+        lines = np.array(segments).round().astype(np.int32).reshape(-1, 1, 4)
+        return lane_outline(lines, height, width, roi_ratio)
+
+    def warmup(self, sample, roi_ratio, sizes=()):
+        """LaneAnalyzer.warmup 과 같은 인자 (스캔라인 계획은 가벼워서 샘플 한 장이면 충분)"""
+        self.detect_outline(sample, roi_ratio)
+
+
+def marking_centers(gradient, max_width):
+    """스캔라인별 밝기 기울기에서 차선 도색 (상승 에지 뒤에 가까운 하강 에지) 의 중심을 찾는 함수
+
+    (스캔라인 번호, 중심 x, 유효 마스크) 배열을 반환한다.
+    """
+    n_rows, n_cols = gradient.shape
+    inner = gradient[:, 1:-1]
+    rising = (inner > GRADIENT_THRESHOLD) & (inner >= gradient[:, :-2]) & (inner > gradient[:, 2:])
+    falling = (inner < -GRADIENT_THRESHOLD) & (inner <= gradient[:, :-2]) & (inner < gradient[:, 2:])
+
+    # 행을 이어 붙인 1차원 좌표에서 상승 에지마다 오른쪽의 첫 하강 에지를 찾는다
+    rise = np.flatnonzero(rising)
+    fall = np.flatnonzero(falling)
+    row = rise // (n_cols - 2)
+    if not len(fall):
+        return row, rise.astype(np.float64), np.zeros(len(rise), bool)
+    nxt = np.minimum(np.searchsorted(fall, rise), len(fall) - 1)
+    fall_at = fall[nxt]
+    keep = (fall_at > rise) & (fall_at // (n_cols - 2) == row) & (fall_at - rise <= max_width)
+
+    # inner 는 gradient 의 1 번 열부터 시작
+    x = (rise % (n_cols - 2) + fall_at % (n_cols - 2)) / 2 + 1
+    return row, x, keep
+
+
+def marking_tracks(y, x, max_step):
+    """도색 위치 (y, x) 를 아래쪽 스캔라인부터 위로 이어서 후보별 (y 배열, x 배열) 리스트로 묶는 함수
+
+    후보마다 첫 점과 마지막 점을 지나는 직선으로 다음 스캔라인의 위치를 예측하고,
+    예측에서 max_step 안쪽의 가장 가까운 후보에 점을 잇는다 (스캔라인마다 후보당 점 하나).
+    이을 후보가 없으면 새 후보를 시작하며, 점선의 빈 구간은 예측으로 건너뛴다.
+    """
+    order = np.lexsort((x, -y))
+    tracks = []
+    for y_i, x_i in zip(y[order].tolist(), x[order].tolist()):
+        best, best_distance = None, max_step
+        for ys, xs in tracks:
+            if ys[-1] == y_i:
+                continue
+            predicted = xs[-1]
+            if len(ys) > 1:
+                predicted += (xs[-1] - xs[0]) / (ys[-1] - ys[0]) * (y_i - ys[-1])
+            distance = abs(predicted - x_i)
+            if distance < best_distance:
+                best, best_distance = (ys, xs), distance
+        if best is None:
+            tracks.append(([y_i], [x_i]))
+        else:
+            best[0].append(y_i)
+            best[1].append(x_i)
+    return [(np.array(ys), np.array(xs)) for ys, xs in tracks if len(ys) >= MIN_POINTS]
+
+
+def fit_line(y, x, outlier_distance):
+    """유한한 점들에 x = slope * y + intercept 를 맞추는 함수 (점이 부족하면 None)
+
+    점선의 빈 구간에서는 옆 차선이나 노면 표시가 잡히므로,
+    outlier_distance 보다 먼 점이 남아 있는 동안 가장 먼 점을 하나씩 버리고 다시 맞춘다.
+    """
+    valid = np.isfinite(x)
+    for _ in range(MAX_OUTLIERS + 1):
+        n = np.count_nonzero(valid)
+        if n < MIN_POINTS:
+            return None
+        y_valid, x_valid = y[valid], x[valid]
+        mean_y = y_valid.mean()
+        mean_x = x_valid.mean()
+        slope = ((y_valid - mean_y) @ (x_valid - mean_x)) / ((y_valid - mean_y) @ (y_valid - mean_y))
+        intercept = mean_x - slope * mean_y
+
+        residual = np.abs(slope * y_valid + intercept - x_valid)
+        worst = np.argmax(residual)
+        if residual[worst] <= outlier_distance:
+            return slope, intercept
+        valid[np.flatnonzero(valid)[worst]] = False
+    return None
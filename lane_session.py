@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from coin_particles import CoinField
+
+# 세션 저장소 기본값
+MAX_SESSIONS = 1000                 # 동시에 유지할 최대 주행 수
+SESSION_TTL = 10 * 60               # 이 시간(초) 동안 프레임이 없으면 버려진 주행으로 보고 제거
+MAX_SESSION_BYTES = 64 * 1024 ** 2  # 모든 세션 상태의 추정 메모리 상한
+
+# 세션 하나의 고정 비용 추정치 (객체, dict, 추적기 행렬 등)
+SESSION_OVERHEAD_BYTES = 4096
+
+
+class LaneSession:
+    """한 번의 주행 동안 유지하는 분석 상태
+
+    예전에는 함수 속성 (analyze_frame.frame_count, display_lines.coins 등) 과 모듈 전역 변수
+    (last_detected_lines) 에 있던 값을 주행마다 따로 가진다. 검출 주기는 추적기 (LaneTracker) 가 센다.
+    같은 세션을 여러 스레드에서 동시에 쓰지만 않으면 분석기 주변에 잠금이 필요 없다.
+    """
+
+    def __init__(self, tracker=None, gate=None):
+        # 차선 추적기 (LaneTracker) 와 변화 감지기 (MotionGate), 사용하지 않으면 None
+        self.tracker = tracker
+        self.gate = gate
+
+        # analyze_frame 이 분석한 프레임 수
+        self.frame_count = 0
+
+        # process_frame 의 검출 상태
+        self.last_detected_lines = None
+        self.compositor = None  # 오버레이 버퍼 (LaneCompositor, 처음 처리할 때 할당)
+
+        # display_lines 의 코인과 점수
+        self.coins = CoinField()
+        self.display_frame_count = 0
+        self.total_score = 0
+        self.valid_frames = 0
+        self.center_frames = 0
+
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    def touch(self):
+        """마지막 사용 시각을 갱신하는 함수"""
+        self.last_used = time.monotonic()
+
+    def reset_detection(self):
+        """추적 상태 (검출 주기 포함) 를 초기화하는 함수"""
+        if self.tracker is not None:
+            self.tracker.reset()
+
+    def reset_score(self):
+        """주행 점수를 초기화하는 함수"""
+        self.total_score = 0
+        self.valid_frames = 0
+        self.center_frames = 0
+
+    def nbytes(self):
+        """세션 상태가 차지하는 메모리 추정치 (바이트)"""
+        size = SESSION_OVERHEAD_BYTES + self.coins.nbytes
+        if isinstance(self.last_detected_lines, np.ndarray):
+            size += self.last_detected_lines.nbytes
+        if self.compositor is not None:
+            size += self.compositor.nbytes
+        if self.gate is not None:
+            size += self.gate.nbytes
+        return size
+
+
+class SessionRegistry:
+    """라이더별 LaneSession 저장소 (LRU + TTL + 메모리 상한)
+
+    주행 종료 (pop) 없이 버려진 세션은 SESSION_TTL 이 지나거나,
+    세션 수나 추정 메모리가 상한을 넘을 때 가장 오래 사용하지 않은 것부터 제거된다.
+    세션 크기는 get() 할 때마다 다시 추정하므로 (직전 요청까지의 상태) 합계는 근사값이다.
+    잠금은 저장소 dict 조작에만 쓰고 분석 중에는 잡지 않는다.
+    """
+
+    def __init__(self, factory=LaneSession, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL,
+                 max_bytes=MAX_SESSION_BYTES):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        # 통계
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, key):
+        """key 의 세션을 반환하는 함수 (없으면 factory 로 새로 만든다)"""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self.factory()
+                self._sessions[key] = session
+            else:
+                self._sessions.move_to_end(key)
+            session.touch()
+
+            size = session.nbytes()
+            self._total_bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._evict(keep=key)
+        return session
+
+    def pop(self, key):
+        """주행이 끝난 세션을 꺼내는 함수 (없으면 None)"""
+        with self._lock:
+            self._total_bytes -= self._sizes.pop(key, 0)
+            return self._sessions.pop(key, None)
+
+    def nbytes(self):
+        """모든 세션의 추정 메모리 (바이트)"""
+        return self._total_bytes
+
+    def _evict(self, keep):
+        """만료되었거나 상한을 넘는 세션을 오래된 것부터 제거하는 함수 (잠금을 잡은 상태에서 호출)"""
+        now = time.monotonic()
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if key == keep:
+                break
+            if (now - session.last_used <= self.ttl and len(self._sessions) <= self.max_sessions and
+                    self._total_bytes <= self.max_bytes):
+                break
+            del self._sessions[key]
+            self._total_bytes -= self._sizes.pop(key, 0)
+            self.evicted += 1
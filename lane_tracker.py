@@ -0,0 +1,245 @@
+import numpy as np
+
+from lane_analyzer import corridor_polygons
+
+# 추적 파라미터 (픽셀 단위, 1/2 해상도 주행 영상에서 매 프레임 검출한 차선 위치 변화 기준)
+PROCESS_NOISE = (0.5, 0.5)       # 프레임당 차선 위치 변화의 표준편차 (아래쪽, 위쪽)
+VELOCITY_NOISE = (0.05, 0.05)    # 프레임당 차선 이동 속도 변화의 표준편차 (아래쪽, 위쪽)
+MEASUREMENT_NOISE = (6.0, 6.0)   # 검출된 차선 위치의 표준편차
+INITIAL_VELOCITY = 2.0           # 새로 시작할 때 모르는 차선 이동 속도의 표준편차 (프레임당, 차선 변경 정도)
+MAX_UNCERTAINTY = 30.0           # 예측 위치의 표준편차가 이 값을 넘으면 간격 전이라도 다시 검출
+INNOVATION_GATE = 18.5           # 정규화 혁신 제곱(NIS)이 이 값을 넘으면 급격한 변화로 판단 (자유도 4, 99.9%)
+LOW_INNOVATION = 3.36            # NIS 가 이 값보다 작으면 (자유도 4 의 중앙값) 예측이 맞는 것으로 보고 간격을 늘림
+MIN_INTERVAL = 4                 # 검출 간격의 최솟값 (새로 시작했거나 예측이 빗나간 직후)
+MAX_INTERVAL = 64                # 검출 간격의 최댓값 (MIN_INTERVAL 의 2의 거듭제곱 배, 예측이 계속 맞는 구간)
+LOST_INTERVAL = 20               # 차선을 놓쳤을 때 재검출 간격
+MAX_MISSES = 3                   # 연속 검출 실패가 이 값을 넘으면 추적 종료
+
+# 이전 차선 주변 탐색 영역의 반폭 (프레임 너비 대비 비율, 여기에 예측 표준편차의 2배를 더함)
+CORRIDOR_BOTTOM = 0.03
+CORRIDOR_TOP = 0.01
+# 두 탐색 영역의 아래쪽 폭 합이 프레임 너비의 이 비율을 넘으면 영역을 쓰지 않음 (ROI 전체 검출보다 이득이 없음)
+CORRIDOR_MAX_COVERAGE = 0.5
+
+# 상태에서 측정하는 값의 순서
+OUTLINE_KEYS = ("bottom_x_r", "top_x_r", "bottom_x_s", "top_x_s")
+
+
+class LaneTracker:
+    """두 차선을 칼만 필터 상태로 유지하면서 필요할 때만 전체 검출을 요청하는 추적기
+
+    각 차선은 아래쪽/위쪽 x 좌표(bottom_x, top_x)로 표현하고,
+    상태는 네 좌표와 각각의 프레임당 변화량으로 이루어진 8차원 벡터이다 (등속 모델).
+    매 프레임 predict() 로 상태를 예측하고, needs_detection() 이 참일 때만 검출 결과로 update() 한다.
+    검출 간격은 필터의 신뢰도를 따른다. 검출이 예측과 잘 맞으면 (NIS < low_innovation) 간격을 두 배로
+    (max_interval 까지), 직전 검출이 맞았는데도 예측 표준편차가 max_uncertainty 를 넘어 일찍 검출했으면 반으로 줄이고,
+    예측을 벗어나면 (NIS > innovation_gate) min_interval 로 돌아가고, 그 검출은 버린 채 다음 프레임에 바로
+    다시 검출해서 또 벗어나면 새 위치에서 추적을 다시 시작한다.
+    정기 검출은 영상 프레임 번호가 간격의 배수일 때 하므로 (간격은 min_interval 의 2의 거듭제곱 배),
+    같은 간격의 추적기는 구간을 나눠 처리해도 같은 프레임에서 검출한다.
+    검출 실패는 측정값이 오지 않은 것으로 보고 예측과 간격을 유지한다.
+    """
+
+    def __init__(self, process_noise=PROCESS_NOISE, velocity_noise=VELOCITY_NOISE,
+                 measurement_noise=MEASUREMENT_NOISE, initial_velocity=INITIAL_VELOCITY,
+                 max_uncertainty=MAX_UNCERTAINTY, innovation_gate=INNOVATION_GATE,
+                 low_innovation=LOW_INNOVATION, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 lost_interval=LOST_INTERVAL, max_misses=MAX_MISSES):
+        self.max_uncertainty = max_uncertainty
+        self.innovation_gate = innovation_gate
+        self.low_innovation = low_innovation
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.lost_interval = lost_interval
+        self.max_misses = max_misses
+
+        # 등속 모델: 위치 += 속도
+        eye = np.eye(4)
+        self.F = np.block([[eye, eye], [np.zeros((4, 4)), eye]])
+        self.H = np.hstack([eye, np.zeros((4, 4))])
+        self.Q = np.diag(np.square(np.concatenate([np.tile(process_noise, 2), np.tile(velocity_noise, 2)])))
+        self.R = np.diag(np.square(np.tile(measurement_noise, 2)))
+        self.P0 = np.diag(np.concatenate([np.diag(self.R), np.full(4, initial_velocity ** 2)]))
+
+        # 통계 (검출 비율 확인용)
+        self.frames = 0
+        self.detections = 0
+        self.frame_index = -1  # 현재 프레임 번호 (검출 격자 기준, seek() 로 맞춤)
+        self.steps = 1  # 직전 predict() 로 넘어간 프레임 수
+        self.corridor_misses = 0  # 탐색 영역에서 찾지 못해 다음 검출을 ROI 전체에서 한 횟수
+
+        self.reset()
+
+    def reset(self):
+        """추적 상태를 초기화하는 함수"""
+        self.x = None
+        self.P = None
+        self.bottom_y = None
+        self.top_y = None
+        self.misses = 0
+        self.interval = self.min_interval
+        self.detect_next = True  # 첫 프레임에서 바로 검출
+        self.since_detection = 0
+        self.early = False  # 이번 검출이 예측 불확실성 때문에 앞당겨졌는지
+        self.rejected = False  # 직전 검출이 예측을 벗어나서 버려졌는지
+        self.corridor_used = False  # 이번 검출에 corridor() 의 탐색 영역을 썼는지
+        self.full_roi_next = False  # 탐색 영역에서 찾지 못해 다음 검출은 ROI 전체에서 할지
+
+    @property
+    def tracking(self):
+        return self.x is not None
+
+    def seek(self, frame_index):
+        """다음 predict() 가 영상의 frame_index 번째 프레임이 되도록 검출 격자 위치를 맞추는 함수 (구간 처리용)"""
+        self.frame_index = frame_index - 1
+
+    def uncertainty(self):
+        """예측 위치 표준편차의 최댓값 (픽셀)"""
+        if self.P is None:
+            return np.inf
+        return float(np.sqrt(np.diag(self.P)[:4].max()))
+
+    def predict(self, steps=1):
+        """steps 프레임 뒤의 차선 위치를 예측하는 함수 (처리하는 프레임마다 한 번 호출)
+
+        프레임을 건너뛰며 처리할 때는 건너뛴 프레임 수까지 steps 로 주면 검출 간격과 격자가 원본 프레임 기준으로 유지된다.
+        """
+        self.frames += 1
+        self.frame_index += steps
+        self.since_detection += steps
+        self.steps = steps
+        if self.x is not None:
+            for _ in range(steps):
+                self.x = self.F @ self.x
+                self.P = self.F @ self.P @ self.F.T + self.Q
+
+    def needs_detection(self):
+        """이번 프레임에 전체 검출이 필요한지 반환하는 함수"""
+        self.early = False
+        if self.detect_next:
+            return True
+        # 정기 검출은 프레임 번호 격자에서 (직전 검출이 간격의 절반 안쪽이었으면 다음 격자로 미룸)
+        # 직전 predict() 가 여러 프레임을 넘었으면 그 사이에 격자를 지났는지 확인
+        interval = self.interval if self.x is not None else self.lost_interval
+        if self.frame_index % interval < self.steps and self.since_detection >= interval // 2:
+            return True
+        # 예측이 불확실해지면 간격 전이라도 검출 (검출이 실패한 뒤에도 min_interval 프레임마다만)
+        self.early = (self.x is not None and self.since_detection >= self.min_interval and
+                      self.uncertainty() > self.max_uncertainty)
+        return self.early
+
+    def update(self, outline):
+        """검출 결과로 상태와 검출 간격을 보정하는 함수
+
+        outline 은 road_outline 과 같은 키를 가진 dict (검출 실패 시 None) 이다.
+        """
+        self.detections += 1
+        self.detect_next = False
+        self.since_detection = 0
+
+        # 탐색 영역에서 찾지 못했으면 차선이 영역 밖으로 벗어났을 수 있으므로 다음 검출은 ROI 전체에서
+        self.full_roi_next = outline is None and self.corridor_used
+        self.corridor_misses += self.full_roi_next
+        self.corridor_used = False
+        if self.early and not self.misses:
+            # 직전 검출이 맞았는데도 간격을 채우기 전에 예측이 불확실해졌으므로 간격을 줄임
+            # (검출 실패로 불확실해진 경우는 측정값이 없었을 뿐이므로 간격을 유지)
+            self.interval = max(self.min_interval, self.interval // 2)
+
+        if outline is None:
+            # 측정값이 오지 않은 것으로 보고 예측을 유지 (공분산은 predict() 에서 계속 커짐)
+            self.misses += 1
+            if self.misses > self.max_misses:
+                self.reset()
+                self.detect_next = False
+            return
+
+        self.misses = 0
+        self.bottom_y = float(outline["bottom_y"])
+        self.top_y = float(outline["top_y"])
+        z = np.array([outline[key] for key in OUTLINE_KEYS], dtype=np.float64)
+
+        if self.x is None:
+            self._initialize(z)
+            return
+
+        # 혁신 (측정값 - 예측값) 과 정규화 혁신 제곱
+        # 검출기는 두 차선의 좌우(r/s)를 바꿔서 내기도 하므로 두 가지 대응 중 가까운 쪽을 쓴다
+        S = self.H @ self.P @ self.H.T + self.R
+        predicted = self.H @ self.x
+        candidates = [z - predicted, z[[2, 3, 0, 1]] - predicted]
+        nis_values = [float(v @ np.linalg.solve(S, v)) for v in candidates]
+        best = int(np.argmin(nis_values))
+        innovation = candidates[best]
+        nis = nis_values[best]
+
+        if nis > self.innovation_gate:
+            self.interval = self.min_interval
+            if not self.rejected:
+                # 예측을 벗어난 검출은 한 번은 버리고 다음 프레임에 바로 다시 검출해서 확인
+                self.rejected = True
+                self.detect_next = True
+                return
+            # 연달아 벗어나면 차선 변경 등 급격한 변화: 예측을 버리고 새로 시작
+            self._initialize(z)
+            return
+        self.rejected = False
+
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ innovation
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+
+        # 정기 검출이 예측과 잘 맞으면 검출 간격을 늘린다
+        if nis < self.low_innovation and not self.early:
+            self.interval = min(self.max_interval, self.interval * 2)
+
+    def _initialize(self, z):
+        """측정값으로 상태를 새로 시작하는 함수 (속도는 0, 검출 간격은 min_interval 부터)"""
+        self.x = np.concatenate([z, np.zeros(4)])
+        self.P = self.P0.copy()
+        self.interval = self.min_interval
+        self.rejected = False
+
+    def corridor(self, height, width):
+        """다음 검출에서 탐색할 차선 주변 영역을 반환하는 함수
+
+        추적이 안정되어 (검출 간격이 min_interval 보다 길어진 뒤) 예측을 신뢰할 수 있을 때만 영역을 반환한다.
+        그렇지 않거나, 직전 검출이 영역에서 차선을 찾지 못했거나, 영역이 ROI 대부분을 덮을 만큼 넓으면
+        None (ROI 사다리꼴 전체에서 검출) 을 반환한다. 영역을 반환하면 다음 update() 가 그 결과로 본다.
+        """
+        self.corridor_used = False
+        if (self.x is None or self.full_roi_next or self.interval <= self.min_interval or
+                self.uncertainty() > self.max_uncertainty):
+            return None
+        sigma = np.sqrt(np.diag(self.P)[:4])
+        half_width_bottom = CORRIDOR_BOTTOM * width + 2 * max(sigma[0], sigma[2])
+        half_width_top = CORRIDOR_TOP * width + 2 * max(sigma[1], sigma[3])
+        if 4 * half_width_bottom > CORRIDOR_MAX_COVERAGE * width:
+            return None
+        self.corridor_used = True
+        return corridor_polygons(self.outline(), height, half_width_bottom, half_width_top)
+
+    def outline(self):
+        """현재 추적 중인 차선을 road_outline 형식의 dict 로 반환하는 함수 (추적 중이 아니면 None)"""
+        if self.x is None:
+            return None
+        outline = {key: float(value) for key, value in zip(OUTLINE_KEYS, self.x[:4])}
+        outline["bottom_y"] = self.bottom_y
+        outline["top_y"] = self.top_y
+        return outline
+
+    def as_lines(self):
+        """추적 중인 두 차선을 HoughLinesP 와 같은 (2, 1, 4) int32 선분 배열로 반환하는 함수"""
+        outline = self.outline()
+        if outline is None:
+            return None
+        bottom_y = int(round(outline["bottom_y"]))
+        top_y = int(np.ceil(outline["top_y"]))
+        return np.array([
+            [[round(outline["bottom_x_r"]), bottom_y, round(outline["top_x_r"]), top_y]],
+            [[round(outline["bottom_x_s"]), bottom_y, round(outline["top_x_s"]), top_y]],
+        ], dtype=np.int32)
+
+    def detection_rate(self):
+        """전체 프레임 중 전체 검출을 수행한 비율"""
+        return self.detections / self.frames if self.frames else 0.0
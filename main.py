@@ -1,6 +1,333 @@
+import csv
 import cv2
 import os
-from lane_detection import process_frame, set_roi_height, reset_detection_counter, DETECTION_INTERVAL
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from lane_detection import (process_frame, advance_frame, iter_lane_results, set_roi_height, reset_detection_counter,
+                            new_session, OUTLINE_KEYS)
+import lane_detection
+from lane_tracker import MIN_INTERVAL, MAX_INTERVAL
+from stage_profiler import PROFILER
+
+# 단계 사이 큐에 쌓아 둘 최대 프레임 수 (디코딩/인코딩이 분석보다 앞서거나 밀려도 메모리는 이만큼만 사용)
+PIPELINE_QUEUE_SIZE = 8
+
+# 진행 상황을 출력할 프레임 간격
+PROGRESS_INTERVAL = 30
+
+# 큐가 가득 차거나 비어 있을 때 중단 요청을 확인하는 간격 (초)
+QUEUE_POLL_SECONDS = 0.1
+
+# 병렬 모드 (LANE_WORKERS > 1) 에서 청크마다 앞쪽에 추적만 하고 버리는 프레임 수 (최대 검출 간격의 배수)
+# 검출 프레임은 프레임 번호 격자로 맞추고 (LaneTracker.seek), 검출 간격과 추적기 상태 (칼만 필터의 속도 추정) 가
+# 순차 처리와 같아질 만큼 검출을 거치도록 잡는다 (884 프레임 영상의 2/3 청크 분할에서 순차 처리와 결과가 같음)
+CHUNK_OVERLAP_INTERVALS = 10
+CHUNK_OVERLAP = CHUNK_OVERLAP_INTERVALS * MAX_INTERVAL
+
+# 출력 영상 코덱
+FOURCC = cv2.VideoWriter_fourcc(*'mp4v')
+
+class StageStats:
+    """파이프라인 단계별 처리 프레임 수와 실제로 일한 시간 (큐 대기 제외)"""
+    
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+    
+    def add(self, seconds):
+        self.frames += 1
+        self.busy += seconds
+    
+    def fps(self):
+        return self.frames / self.busy if self.busy else 0.0
+
+def _put(q, item, stop):
+    """중단 요청이 없는 동안 q 에 item 을 넣는 함수 (중단되면 False)"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get(q, stop):
+    """중단 요청이 없는 동안 q 에서 꺼내는 함수 (중단되면 None)"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=QUEUE_POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return None
+
+def run_pipeline(cap, out, size, queue_size=PIPELINE_QUEUE_SIZE):
+    """디코딩 스레드 -> 분석 (현재 스레드) -> 인코딩 스레드로 영상을 처리하고 처리한 프레임 수를 반환하는 함수
+    
+    단계 사이는 크기가 queue_size 인 큐로 연결한다. 분석은 차선 추적 상태 때문에 한 스레드에서
+    순서대로 하고, 인코딩 스레드 하나가 받은 순서대로 쓰므로 출력은 순차 처리와 같다.
+    OpenCV 디코딩/인코딩/분석은 GIL 을 놓으므로 세 단계가 겹쳐서 실행된다.
+    어느 단계에서든 예외가 나면 나머지 단계를 멈추고 그 예외를 다시 발생시킨다.
+    """
+    decoded = queue.Queue(queue_size)
+    analyzed = queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+    stats = {name: StageStats(name) for name in ("decode", "analyze", "encode")}
+    end = object()  # 마지막 프레임 뒤에 보내는 표시
+    
+    def decode():
+        try:
+            while True:
+                timer = PROFILER.timer()
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                
+                # 프레임 크기를 1/2로 축소
+                frame = cv2.resize(frame, size)
+                stats["decode"].add(time.perf_counter() - start)
+                timer.mark("decode")
+                timer.done()
+                if not _put(decoded, frame, stop):
+                    return
+            _put(decoded, end, stop)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+    
+    def encode():
+        try:
+            while True:
+                frame = _get(analyzed, stop)
+                if frame is None or frame is end:
+                    return
+                timer = PROFILER.timer()
+                start = time.perf_counter()
+                out.write(frame)
+                stats["encode"].add(time.perf_counter() - start)
+                timer.mark("encode")
+                timer.done()
+                
+                written = stats["encode"].frames
+                if written % PROGRESS_INTERVAL == 0:
+                    elapsed = time.perf_counter() - started
+                    print(f"처리된 프레임: {written} ({written / elapsed:.1f} fps, "
+                          f"대기 중: 디코딩 {decoded.qsize()} / 인코딩 {analyzed.qsize()})")
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=decode, name="decode", daemon=True),
+               threading.Thread(target=encode, name="encode", daemon=True)]
+    for thread in threads:
+        thread.start()
+    
+    try:
+        while True:
+            frame = _get(decoded, stop)
+            if frame is None:
+                break
+            if frame is end:
+                _put(analyzed, end, stop)
+                break
+            start = time.perf_counter()
+            result_frame = process_frame(frame)
+            stats["analyze"].add(time.perf_counter() - start)
+            if not _put(analyzed, result_frame, stop):
+                break
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+    
+    if errors:
+        raise errors[0]
+    
+    elapsed = time.perf_counter() - started
+    frame_count = stats["encode"].frames
+    if frame_count == 0:
+        print("에러: 첫 프레임을 읽을 수 없습니다.")
+    print(f"\n단계별 처리량 (전체 {frame_count / elapsed if elapsed else 0.0:.1f} fps):")
+    for stage in stats.values():
+        print(f"{stage.name:<8} {stage.frames:>6} 프레임  {stage.busy:>7.2f}초  {stage.fps():>7.1f} fps")
+    return frame_count
+
+def process_chunk(video_path, segment_path, size, fps, roi_ratio, start, end, overlap=CHUNK_OVERLAP):
+    """[start, end) 프레임을 처리해서 segment_path 에 인코딩하고 프레임별 결과를 반환하는 함수 (작업 프로세스에서 실행)
+    
+    start - overlap 프레임부터 시작해서 앞쪽 overlap 프레임은 추적기/점수/코인 상태만 진행하고 버린다
+    (합성/인코딩 없이 advance_frame, 검출하는 프레임만 디코딩).
+    추적기는 시작 프레임 번호로 seek 해서 순차 처리와 같은 프레임에서 검출한다.
+    end 가 None 이면 영상 끝까지 처리한다. 결과는 (프레임 번호, 검출 여부, 유효 프레임 여부, 중앙 주행 여부) 리스트이다.
+    화면에 표시되는 누적 점수는 청크마다 새로 센다 (전체 점수는 반환된 결과로 합산).
+    """
+    set_roi_height(roi_ratio)
+    session = new_session()
+    tracker = session.tracker
+    
+    warm_start = max(0, start - overlap)
+    # 추적기의 검출 격자와 코인 생성 주기 (display_lines 호출 횟수 기준) 를 순차 처리와 맞춤
+    tracker.seek(warm_start)
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, warm_start)
+    session.display_frame_count = warm_start
+    
+    out = None
+    results = []
+    index = warm_start
+    width, height = size
+    try:
+        while index < start and cap.grab():
+            advance_frame(lambda: cv2.resize(cap.retrieve()[1], size), height, width, session)
+            index += 1
+        while end is None or index < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index == start:
+                session.reset_score()
+                out = cv2.VideoWriter(segment_path, FOURCC, fps, size)
+            
+            detections = tracker.detections
+            valid_frames = session.valid_frames
+            center_frames = session.center_frames
+            out.write(process_frame(cv2.resize(frame, size), session))
+            results.append((index, tracker.detections > detections,
+                            session.valid_frames > valid_frames, session.center_frames > center_frames))
+            index += 1
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+    return results
+
+def join_segments(segment_paths, output_path, fps, size):
+    """청크별 영상을 순서대로 이어 붙이는 함수 (ffmpeg 가 있으면 재인코딩 없이, 없으면 다시 인코딩)"""
+    segment_paths = [path for path in segment_paths if os.path.exists(path)]
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        list_path = output_path + '.segments.txt'
+        with open(list_path, 'w') as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        try:
+            subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                            '-i', list_path, '-c', 'copy', output_path], check=True)
+            return
+        except subprocess.CalledProcessError:
+            print("경고: ffmpeg 로 이어 붙이지 못해 다시 인코딩합니다.")
+        finally:
+            os.remove(list_path)
+    
+    out = cv2.VideoWriter(output_path, FOURCC, fps, size)
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        out.release()
+
+def run_chunked(video_path, output_path, size, fps, workers, overlap=CHUNK_OVERLAP):
+    """영상을 workers 개의 프레임 구간으로 나눠 프로세스마다 처리하고 이어 붙이는 함수 (처리한 프레임 수를 반환)
+    
+    작업 프로세스마다 VideoCapture 를 열어 자기 구간으로 이동하고, 구간 앞 overlap 프레임으로
+    추적기와 코인 상태를 채운 뒤 처리한다. 전체 점수와 검출 비율은 프레임별 결과를 합쳐서 계산한다.
+    """
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    
+    # 프레임 수 정보가 없거나 너무 짧으면 구간 하나로 처리 (마지막 구간은 영상 끝까지)
+    workers = max(1, min(workers, total // max(1, overlap)))
+    bounds = [total * i // workers for i in range(workers)] + [None]
+    
+    started = time.perf_counter()
+    segment_dir = tempfile.mkdtemp(prefix='segments_', dir=os.path.dirname(os.path.abspath(output_path)))
+    segment_paths = [os.path.join(segment_dir, f'{i:04d}.mp4') for i in range(workers)]
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(process_chunk, video_path, segment_paths[i], size, fps,
+                                   lane_detection.ROI_HEIGHT_RATIO, bounds[i], bounds[i + 1], overlap)
+                       for i in range(workers)]
+            results = []
+            for i, future in enumerate(futures):
+                results.extend(future.result())
+                print(f"구간 {i + 1}/{workers} 완료 (누적 {len(results)} 프레임)")
+        join_segments(segment_paths, output_path, fps, size)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+    
+    elapsed = time.perf_counter() - started
+    frame_count = len(results)
+    valid = sum(result[2] for result in results)
+    centered = sum(result[3] for result in results)
+    detected = sum(result[1] for result in results)
+    print(f"\n병렬 처리: {workers} 프로세스, {frame_count / elapsed if elapsed else 0.0:.1f} fps")
+    if frame_count:
+        print(f"검출 비율: {detected / frame_count:.1%}")
+    if valid:
+        print(f"주행 점수: {int(centered / valid * 100)}% ({centered}/{valid})")
+    return frame_count
+
+def write_results_csv(results, f, progress=None):
+    """iter_lane_results 의 결과를 CSV 로 쓰고 (프레임 수, 검출한 프레임 수) 를 반환하는 함수
+    
+    프레임마다 한 줄 (frame, detected, score, road_outline 좌표) 이며 점수가 없으면 score 와 좌표를 비워 둔다.
+    progress 를 주면 한 줄 쓸 때마다 지금까지 쓴 프레임 수로 호출한다.
+    """
+    writer = csv.writer(f)
+    writer.writerow(("frame", "detected", "score") + OUTLINE_KEYS)
+    frame_count = 0
+    detections = 0
+    for index, _, result in results:
+        outline = result["road_outline"]
+        writer.writerow([index, int(result["detected"]),
+                         "" if result["score"] is None else int(result["score"])] +
+                        [f"{outline[key]:.1f}" if outline else "" for key in OUTLINE_KEYS])
+        detections += result["detected"]
+        frame_count += 1
+        if progress is not None:
+            progress(frame_count)
+    return frame_count, detections
+
+def run_headless(cap, size, results_path):
+    """오버레이 없이 점수만 계산해서 프레임별 결과를 CSV 로 쓰는 함수 (처리한 프레임 수를 반환)
+    
+    iter_lane_results 로 모든 프레임을 cap.grab() 으로 넘기고, 추적기가 검출을 요청한 프레임만
+    retrieve() 로 색 변환/축소까지 해서 분석한다 (결과 파일 형식은 write_results_csv).
+    """
+    session = lane_detection._session
+    started = time.perf_counter()
+    
+    def progress(frame_count):
+        if frame_count % PROGRESS_INTERVAL == 0:
+            print(f"처리된 프레임: {frame_count} ({frame_count / (time.perf_counter() - started):.1f} fps)")
+    
+    with open(results_path, 'w', newline='') as f:
+        frame_count, detections = write_results_csv(
+            iter_lane_results(cap, size=size, session=session), f, progress)
+    
+    if frame_count == 0:
+        print("에러: 첫 프레임을 읽을 수 없습니다.")
+    else:
+        print(f"\n검출한 프레임: {detections}/{frame_count} ({detections / frame_count:.1%})")
+        print(f"주행 점수: {session.total_score}% ({session.center_frames}/{session.valid_frames})")
+    return frame_count
 
 def main():
     # ROI 높이 설정 (화면 상단 80%부터 검출)
@@ -9,6 +336,10 @@ def main():
     # 차선 검출 카운터 초기화
     reset_detection_counter()
     
+    # 단계별 소요 시간 측정 (LANE_PROFILE_ALLOCATIONS=1 이면 할당 크기도 측정)
+    if not PROFILER.enabled:
+        PROFILER.enable(allocations=os.getenv('LANE_PROFILE_ALLOCATIONS', '').lower() in ('1', 'true'))
+    
     # 비디오 파일 경로
     video_path = "test_road_3.mp4"
     
@@ -49,40 +380,39 @@ def main():
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # 출력 비디오 설정
-    out = cv2.VideoWriter(f'{output_dir}/output_video.mp4',
-                         cv2.VideoWriter_fourcc(*'mp4v'),
-                         fps, (width, height))
+    # 출력 비디오 경로
+    output_path = os.path.join(output_dir, 'output_video.mp4')
     
     print("\n영상 처리를 시작합니다...")
     print(f"입력 크기: {orig_width}x{orig_height}")
     print(f"출력 크기: {width}x{height}")
     print(f"FPS: {fps}")
-    print(f"차선 검출 간격: {DETECTION_INTERVAL} 프레임 ({DETECTION_INTERVAL/fps:.1f}초)")
-    frame_count = 0
+    print(f"차선 검출 간격: {MIN_INTERVAL}~{MAX_INTERVAL} 프레임 ({MIN_INTERVAL/fps:.1f}~{MAX_INTERVAL/fps:.1f}초, 추적 신뢰도에 따라)")
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            if frame_count == 0:
-                print("에러: 첫 프레임을 읽을 수 없습니다.")
-            break
-        
-        # 프레임 크기를 1/2로 축소
-        frame = cv2.resize(frame, (width, height))
-        result_frame = process_frame(frame)
-        out.write(result_frame)
-        
-        frame_count += 1
-        if frame_count % 30 == 0:
-            print(f"처리된 프레임: {frame_count}")
+    # LANE_HEADLESS=1 이면 그리기/인코딩 없이 점수만 계산 (보관된 주행 재채점용)
+    # LANE_WORKERS > 1 이면 영상을 프레임 구간으로 나눠 여러 프로세스에서 처리
+    headless = os.getenv('LANE_HEADLESS', '').lower() in ('1', 'true')
+    workers = int(os.getenv('LANE_WORKERS', '1'))
+    if headless:
+        output_path = os.path.join(output_dir, 'results.csv')
+        frame_count = run_headless(cap, (width, height), output_path)
+        cap.release()
+    elif workers > 1:
+        cap.release()
+        frame_count = run_chunked(video_path, output_path, (width, height), fps, workers)
+    else:
+        out = cv2.VideoWriter(output_path, FOURCC, fps, (width, height))
+        frame_count = run_pipeline(cap, out, (width, height))
+        cap.release()
+        out.release()
     
     print(f"\n처리 완료:")
     print(f"총 처리된 프레임: {frame_count}")
-    print(f"출력 파일: {os.path.join(output_dir, 'output_video.mp4')}")
+    print(f"출력 파일: {output_path}")
     
-    cap.release()
-    out.release()
+    # 병렬 모드의 단계별 시간은 각 작업 프로세스에 남는다
+    print(f"\n단계별 소요 시간:")
+    print(PROFILER.report())
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
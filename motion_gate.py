@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+# 변화 감지 파라미터
+THUMBNAIL_SIZE = (32, 18)   # 비교용 축소 흑백 이미지 크기 (width, height)
+MOTION_THRESHOLD = 0.6      # 썸네일 평균 밝기 차이가 이 값 미만이면 같은 장면으로 판단 (0~255)
+MAX_REUSE = 30              # 연속으로 재사용할 수 있는 최대 프레임 수
+
+
+def thumbnail(frame, size=THUMBNAIL_SIZE):
+    """비교용 축소 흑백 이미지를 만드는 함수"""
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small
+
+
+class MotionGate:
+    """직전에 분석한 프레임과 거의 같은 프레임이면 이전 결과를 재사용하게 하는 변화 감지기 (라이더별 하나)
+
+    신호 대기처럼 장면이 멈춰 있을 때 analyze_frame 전체를 다시 돌리지 않기 위해 사용한다.
+    비교 기준은 마지막으로 '분석한' 프레임이므로 느린 변화가 누적되어도 결국 다시 분석한다.
+    """
+
+    def __init__(self, threshold=MOTION_THRESHOLD, max_reuse=MAX_REUSE, size=THUMBNAIL_SIZE):
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self.size = size
+
+        self._reference = None
+        self._pending = None
+        self._result = None
+        self._reused_in_row = 0
+
+        # 통계 (임계값 조정용)
+        self.checks = 0
+        self.hits = 0
+
+    @property
+    def nbytes(self):
+        """저장해 둔 썸네일이 차지하는 메모리 (바이트)"""
+        return sum(image.nbytes for image in (self._reference, self._pending) if image is not None)
+
+    def difference(self, frame):
+        """마지막으로 분석한 프레임과의 썸네일 평균 밝기 차이 (기준 프레임이 없으면 inf)"""
+        self._pending = thumbnail(frame, self.size)
+        if self._reference is None or self._reference.shape != self._pending.shape:
+            return np.inf
+        return float(cv2.norm(self._pending, self._reference, cv2.NORM_L1)) / self._pending.size
+
+    def check(self, frame):
+        """재사용할 수 있으면 이전 결과를, 아니면 None 을 반환하는 함수
+
+        None 이 반환되면 호출한 쪽에서 프레임을 분석한 뒤 store() 로 결과를 저장해야 한다.
+        """
+        self.checks += 1
+        difference = self.difference(frame)
+        if (self._result is not None and self._reused_in_row < self.max_reuse and
+                difference < self.threshold):
+            self.hits += 1
+            self._reused_in_row += 1
+            return self._result
+        return None
+
+    def store(self, result):
+        """방금 분석한 프레임의 결과를 재사용 기준으로 저장하는 함수"""
+        self._reference = self._pending
+        self._pending = None
+        self._result = result
+        self._reused_in_row = 0
+
+    def hit_rate(self):
+        """전체 확인 중 이전 결과를 재사용한 비율"""
+        return self.hits / self.checks if self.checks else 0.0
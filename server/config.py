@@ -17,6 +17,50 @@ class Config:
     # API
     API_TOKEN = os.getenv('API_TOKEN', 'test-token')
     
+    # Lane analyzer working resolution ("WIDTHxHEIGHT", empty to analyze at upload resolution). Frames are
+    # scaled uniformly so their long side matches the larger of the two numbers
+    ANALYZER_WORKING_SIZE = os.getenv('ANALYZER_WORKING_SIZE', '960x540')
+    
+    # Lane detection engine: "hough" (Canny + HoughLinesP), "birdseye" (top-down sliding windows)
+    # or "scanline" (1D edges on a few rows, fastest)
+    ANALYZER_ENGINE = os.getenv('ANALYZER_ENGINE', 'hough')
+    
+    # Preprocessing profile of the hough engine: "quality", "balanced" (CLAHE on the ROI band only)
+    # or "fast" (no CLAHE)
+    ANALYZER_PROFILE = os.getenv('ANALYZER_PROFILE', 'quality')
+    
+    # Frames analyzed at the same time (default: CPU count); further /video_frame requests wait for a slot
+    ANALYZER_WORKERS = int(os.getenv('ANALYZER_WORKERS', str(os.cpu_count() or 1)))
+    
+    # Switch to the fast "scanline" engine while more than this many frames are waiting for an analyzer
+    # slot (0 disables). Must stay below SERVER_THREADS - ANALYZER_WORKERS or the queue can never get that long
+    SCANLINE_QUEUE_DEPTH = int(os.getenv('SCANLINE_QUEUE_DEPTH', '2'))
+    
+    # waitress worker threads (requests accepted and handled at the same time)
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '16'))
+    
+    # Track lanes per rider and only rerun full detection when the tracker asks for it
+    LANE_TRACKING = os.getenv('LANE_TRACKING', 'False').lower() == 'true'
+    
+    # Reuse the previous result when a rider's frame barely changed (mean thumbnail difference, 0 disables)
+    MOTION_GATE_THRESHOLD = float(os.getenv('MOTION_GATE_THRESHOLD', '0.6'))
+    
+    # Skip lane detection on dark, overexposed, blurred or featureless frames
+    FRAME_QUALITY_CHECKS = os.getenv('FRAME_QUALITY_CHECKS', 'True').lower() == 'true'
+    
+    # Per-rider analysis sessions: abandoned rides are evicted after LANE_SESSION_TTL seconds without
+    # frames, or least recently used first when the count or estimated memory exceeds the limits
+    LANE_SESSION_MAX = int(os.getenv('LANE_SESSION_MAX', '1000'))
+    LANE_SESSION_TTL = float(os.getenv('LANE_SESSION_TTL', '600'))
+    LANE_SESSION_MEMORY_MB = float(os.getenv('LANE_SESSION_MEMORY_MB', '64'))
+    
+    # Decode /video_frame uploads straight to grayscale, reduced toward ANALYZER_WORKING_SIZE when possible
+    # (IMREAD_REDUCED_GRAYSCALE_2/4/8). Oversized JPEG/PNG uploads are rejected from the header; other
+    # formats are rejected before decoding
+    FRAME_GRAYSCALE_DECODE = os.getenv('FRAME_GRAYSCALE_DECODE', 'True').lower() == 'true'
+    FRAME_MAX_BYTES = int(os.getenv('FRAME_MAX_BYTES', str(8 * 1024 ** 2)))
+    FRAME_MAX_PIXELS = int(os.getenv('FRAME_MAX_PIXELS', str(3840 * 2160)))
+    
     # Socket IO
     SOCKETIO_CORS_ALLOWED_ORIGINS = os.getenv('CORS_ORIGINS', '*')
     
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# 단계별로 보관할 최근 샘플 수 (링 버퍼)
+RING_SIZE = 4096
+
+# 보고서에 표시할 백분위수
+PERCENTILES = (50, 95, 99)
+
+
+class _NullTimer:
+    """프로파일링이 꺼져 있을 때 쓰는 아무것도 하지 않는 타이머 (메서드 호출 비용만 든다)"""
+
+    def mark(self, stage):
+        pass
+
+    def skip(self):
+        pass
+
+    def done(self):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    """한 번의 처리 (프레임 하나 등) 동안 단계별 시간을 모았다가 done() 에서 한꺼번에 기록하는 타이머
+
+    mark(stage) 는 직전 mark (또는 타이머 생성) 이후의 시간을 stage 에 더한다.
+    같은 단계를 여러 번 mark 하면 합쳐서 샘플 하나로 기록한다.
+    """
+
+    __slots__ = ("profiler", "last", "base", "stages")
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.stages = {}
+        self.base = 0
+        if profiler.allocations:
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        nbytes = 0
+        if self.profiler.allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            nbytes = max(0, peak - self.base)
+            self.base = current
+            tracemalloc.reset_peak()
+        seconds, allocated = self.stages.get(stage, (0.0, 0))
+        self.stages[stage] = (seconds + now - self.last, allocated + nbytes)
+        self.last = time.perf_counter()
+
+    def skip(self):
+        """직전 mark 이후의 시간을 어느 단계에도 넣지 않는 함수 (안쪽 타이머가 따로 기록한 구간)"""
+        if self.profiler.allocations:
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.last = time.perf_counter()
+
+    def done(self):
+        for stage, (seconds, nbytes) in self.stages.items():
+            self.profiler.record(stage, seconds, nbytes)
+        self.stages = {}
+
+
+class StageProfiler:
+    """처리 단계별 소요 시간 (및 선택적으로 할당 크기) 을 링 버퍼에 모으는 프로파일러
+
+    꺼져 있으면 timer() 가 NULL_TIMER 를 반환하므로 계측 코드를 그대로 두어도 비용이 거의 없다.
+    allocations=True 이면 tracemalloc 으로 단계마다 새로 할당된 최대 바이트 수도 기록한다 (느림).
+    할당 크기는 타이머가 중첩되면 (분석기 안쪽 단계) 바깥 단계 값이 작게 잡힐 수 있는 근사값이다.
+    """
+
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self.enabled = False
+        self.allocations = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self, allocations=False):
+        """프로파일링을 켜는 함수"""
+        self.allocations = allocations
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self):
+        """프로파일링을 끄는 함수 (모은 샘플은 유지)"""
+        self.enabled = False
+        if self.allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.allocations = False
+
+    def reset(self):
+        """모은 샘플을 모두 지우는 함수"""
+        with self._lock:
+            self._seconds = {}
+            self._bytes = {}
+            self._counts = {}
+
+    def timer(self):
+        """처리 하나의 단계별 시간을 잴 타이머를 반환하는 함수 (꺼져 있으면 NULL_TIMER)"""
+        if not self.enabled:
+            return NULL_TIMER
+        return _StageTimer(self)
+
+    def record(self, stage, seconds, nbytes=0):
+        """단계 샘플 하나를 링 버퍼에 기록하는 함수"""
+        with self._lock:
+            count = self._counts.get(stage)
+            if count is None:
+                count = 0
+                self._seconds[stage] = np.zeros(self.size)
+                self._bytes[stage] = np.zeros(self.size, np.int64)
+            index = count % self.size
+            self._seconds[stage][index] = seconds
+            self._bytes[stage][index] = nbytes
+            self._counts[stage] = count + 1
+
+    def summary(self):
+        """단계별 {"count", "total_ms", "p50_ms", "p95_ms", "p99_ms", "mean_bytes"} dict 를 반환하는 함수
+
+        백분위수와 평균 할당 크기는 링 버퍼에 남아 있는 최근 샘플 기준이고, count/total_ms 는
+        링 버퍼의 샘플 평균에 전체 샘플 수를 곱한 추정치이다.
+        """
+        with self._lock:
+            stages = {stage: (self._seconds[stage][:min(count, self.size)].copy(),
+                              self._bytes[stage][:min(count, self.size)].copy(), count)
+                      for stage, count in self._counts.items()}
+
+        summary = {}
+        for stage, (seconds, nbytes, count) in stages.items():
+            milliseconds = seconds * 1000
+            p50, p95, p99 = np.percentile(milliseconds, PERCENTILES)
+            summary[stage] = {
+                "count": count,
+                "total_ms": float(milliseconds.mean() * count),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "mean_bytes": float(nbytes.mean()),
+            }
+        return summary
+
+    def report(self):
+        """단계별 소요 시간 표를 문자열로 반환하는 함수 (전체 시간이 큰 단계부터)"""
+        summary = self.summary()
+        if not summary:
+            return "No stage samples recorded."
+
+        grand_total = sum(stats["total_ms"] for stats in summary.values())
+        lines = [f"{'stage':<16}{'count':>8}{'share':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+                 + (f"{'alloc KB':>11}" if self.allocations else "")]
+        for stage, stats in sorted(summary.items(), key=lambda item: -item[1]["total_ms"]):
+            share = stats["total_ms"] / grand_total if grand_total else 0.0
+            line = (f"{stage:<16}{stats['count']:>8}{share:>8.1%}"
+                    f"{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+            if self.allocations:
+                line += f"{stats['mean_bytes'] / 1024:>11.1f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+# 프로세스 전체에서 공유하는 프로파일러 (LANE_PROFILE=1 이면 시작부터 켜짐)
+PROFILER = StageProfiler()
+if os.getenv("LANE_PROFILE", "").lower() in ("1", "true"):
+    PROFILER.enable(allocations=os.getenv("LANE_PROFILE_ALLOCATIONS", "").lower() in ("1", "true"))